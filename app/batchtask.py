@@ -0,0 +1,261 @@
+#batchtask.py
+import math
+import os
+from datetime import datetime, timedelta, timezone
+import cv2
+import numpy as np
+from celery import chord
+
+from app import crud
+from app.celery import celery_app
+from app.database import SessionLocal
+from app.events import publish_incident
+from app.models import Incident
+from app.commontasks import Detections, detections_from_result
+from app.inferenceprofile import DEFAULT_PROFILE, InferenceProfile, get_inference_profile, inference_options, input_size
+from app.modelcache import get_model
+from app.preprocess import LetterboxPreprocessor
+from app.rules import DEFAULT_RULES, RuleContext, build_rules, encode_frame, get_rule_config
+
+
+# Length of the piece of video handed to a single chunk task
+CHUNK_SECONDS = int(os.getenv("BATCH_CHUNK_SECONDS", 300))
+# Number of frames sent to the model in one call
+INFERENCE_BATCH_SIZE = int(os.getenv("BATCH_INFERENCE_SIZE", 16))
+# Frames analysed per second of video, 10 matches the 0.1 s pacing of the live streams
+SAMPLE_FPS = float(os.getenv("BATCH_SAMPLE_FPS", 10))
+# Same debounce as the live streams, measured in video time
+DEBOUNCE_SECONDS = 60
+
+
+def probe_video(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video file {video_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    if fps <= 0 or frame_count <= 0:
+        raise RuntimeError(f"Could not read frame rate or length of {video_path}")
+    return fps, frame_count
+
+
+def evaluate_frame(rules, names, frame_width, detections, context):
+    """Run the rule set of the live streams on one inferred frame, returns its violations and its (class_name, confidence, region) incidents."""
+    violations = rules.evaluate(detections, names, frame_width, context)
+    return violations, rules.incidents(violations)
+
+
+def detections_to_lists(detections):
+    """Detections as plain lists, to send through the broker."""
+    return [detections.xyxy.tolist(), detections.conf.tolist(), detections.cls.tolist()]
+
+
+def detections_from_lists(values):
+    xyxy, conf, cls = values
+    return Detections(np.array(xyxy, dtype=np.float32).reshape(-1, 4), np.array(conf, dtype=np.float32),
+                      np.array(cls, dtype=int))
+
+
+@celery_app.task
+def analyse_video_chunk(detection_type, video_path, model_path, start_frame, end_frame, fps, frame_step, confidence, scenarios, profile=None, rules=None):
+    """
+    Analyse frames [start_frame, end_frame) of a video. Returns the model's class names and every
+    incident candidate in position order, not debounced: whether a candidate is kept depends on the
+    candidates of the previous chunks, so only merge_video_analysis can debounce. A candidate
+    carries the detections of its frame rather than a JPEG, the merge only renders the kept ones.
+    rules is the rule config of the recording, the built-in one of detection_type when not given.
+    """
+    model = get_model(model_path)
+    rules = build_rules(rules or DEFAULT_RULES[detection_type])
+    context = RuleContext(confidence, scenarios)
+    # Sent as a list through the broker
+    profile = InferenceProfile(*profile) if profile else DEFAULT_PROFILE
+    preprocessor = LetterboxPreprocessor(input_size(model, profile), batch_size=INFERENCE_BATCH_SIZE)
+    options = inference_options(model, profile)
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    candidates = []
+    batch_frames = []
+    batch_positions = []
+    batch_metas = []
+
+    def flush_batch():
+        results = model(preprocessor.tensor_batch(len(batch_frames)), **options)
+        for frame, position, meta, result in zip(batch_frames, batch_positions, batch_metas, results):
+            detections = detections_from_result(result, meta)
+            _, incidents = evaluate_frame(rules, model.names, frame.shape[1], detections, context)
+            if not incidents:
+                continue
+
+            frame_detections = detections_to_lists(detections)
+            for class_name, class_confidence, _ in incidents:
+                candidates.append({
+                    "position": position,
+                    "class_name": class_name,
+                    "confidence": class_confidence,
+                    "detections": frame_detections,
+                })
+        batch_frames.clear()
+        batch_positions.clear()
+        batch_metas.clear()
+
+    try:
+        for position in range(start_frame, end_frame):
+            # Frames that are not sampled are only grabbed, which skips the colour conversion and copy
+            if (position - start_frame) % frame_step:
+                if not cap.grab():
+                    break
+                continue
+
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            batch_metas.append(preprocessor(frame, index=len(batch_frames)))
+            batch_frames.append(frame)
+            batch_positions.append(position)
+            if len(batch_frames) == INFERENCE_BATCH_SIZE:
+                flush_batch()
+
+        if batch_frames:
+            flush_batch()
+    finally:
+        cap.release()
+
+    print(f"Analysed frames {start_frame}-{end_frame} of {video_path}: {len(candidates)} candidate incident(s).")
+    return {"names": model.names, "candidates": candidates}
+
+
+def debounce_candidates(candidates, fps, debounce_seconds=DEBOUNCE_SECONDS):
+    """The candidates kept by the debounce of the live streams, in video time, over the whole video at once."""
+    kept = []
+    last_offsets = {}
+    for candidate in sorted(candidates, key=lambda c: c["position"]):
+        offset = candidate["position"] / fps
+        last_offset = last_offsets.get(candidate["class_name"])
+        if last_offset is not None and offset - last_offset < debounce_seconds:
+            continue
+
+        last_offsets[candidate["class_name"]] = offset
+        kept.append(candidate)
+    return kept
+
+
+def render_frames(video_path, candidates, rules, names, context):
+    """position -> annotated JPEG of the frames of the candidates, each frame read and encoded once."""
+    frames = {}
+    cap = cv2.VideoCapture(video_path)
+    try:
+        for candidate in candidates:
+            position = candidate["position"]
+            if position in frames:
+                continue
+
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            ret, frame = cap.read()
+            if not ret:
+                raise RuntimeError(f"Could not read frame {position} of {video_path}")
+
+            detections = detections_from_lists(candidate["detections"])
+            violations, _ = evaluate_frame(rules, names, frame.shape[1], detections, context)
+            rules.annotate(frame, detections, names, violations, context)
+            frames[position] = encode_frame(frame).tobytes()
+    finally:
+        cap.release()
+    return frames
+
+
+@celery_app.task
+def merge_video_analysis(chunk_results, record_id, video_start, fps, detection_type, video_path, confidence, scenarios, rules=None):
+    """
+    Debounce the candidates of every chunk in one pass, as a sequential run would, then render the
+    frames of the kept ones and save them with video-time timestamps.
+    """
+    video_start = datetime.fromisoformat(video_start)
+    candidates = [c for chunk in chunk_results for c in chunk["candidates"]]
+    kept = debounce_candidates(candidates, fps)
+
+    rules = build_rules(rules or DEFAULT_RULES[detection_type])
+    # Class ids arrive as strings from the JSON serializer
+    names = {int(cls): name for chunk in chunk_results for cls, name in chunk["names"].items()}
+    frames = render_frames(video_path, kept, rules, names, RuleContext(confidence, scenarios))
+
+    incidents = [
+        Incident(
+            recording_id=record_id,
+            class_name=candidate["class_name"],
+            confidence=candidate["confidence"],
+            bbox='',
+            frame=frames[candidate["position"]],
+            timestamp=video_start + timedelta(seconds=candidate["position"] / fps)
+        )
+        for candidate in kept
+    ]
+
+    db = SessionLocal()
+    try:
+        db.add_all(incidents)
+        db.commit()
+        print(f"Video analysis for recording {record_id} saved {len(incidents)} incident(s).")
+
+        recording = crud.get_recording(db=db, recording_id=record_id)
+        for incident in incidents:
+            publish_incident(incident, recording)
+    except Exception as e:
+        print(f"Error saving to DB: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    return {"record_id": record_id, "candidates": len(candidates), "incidents": len(incidents)}
+
+
+@celery_app.task
+def run_video_analysis(detection_type, video_path, model_path, record_id, video_start=None, chunk_seconds=CHUNK_SECONDS, sample_fps=SAMPLE_FPS):
+    """
+    Analyse a recorded video file as fast as the workers allow. The file is split in chunks of
+    chunk_seconds analysed in parallel by the jobs workers, and the merged incidents are timestamped
+    from video_start (ISO format, defaults to the recording start time) plus the frame position.
+    """
+    db = SessionLocal()
+    try:
+        recording = crud.get_recording(db=db, recording_id=record_id)
+        if recording.confidence:
+            confidence = recording.confidence / 100
+        else:
+            confidence = crud.get_zone_confidence_level(db, recording.camera_id)
+        scenarios = crud.get_zone_scenario(db=db, recording_id=record_id)
+        # Sent as plain data through the broker, each chunk builds its own rule set
+        rules = get_rule_config(db, record_id, DEFAULT_RULES.get(detection_type))
+        profile = get_inference_profile(db, record_id, build_rules(rules).classes(RuleContext(confidence, scenarios)))
+
+        if video_start is None:
+            start = recording.starttime or datetime.now(timezone.utc)
+            video_start = start.replace(tzinfo=start.tzinfo or timezone.utc).isoformat()
+    finally:
+        db.close()
+
+    fps, frame_count = probe_video(video_path)
+    frame_step = max(1, round(fps / sample_fps))
+    frames_per_chunk = max(frame_step, int(chunk_seconds * fps))
+    chunk_count = math.ceil(frame_count / frames_per_chunk)
+
+    header = [
+        analyse_video_chunk.s(detection_type, video_path, model_path,
+                              start_frame, min(start_frame + frames_per_chunk, frame_count),
+                              fps, frame_step, confidence, scenarios, list(profile), rules)
+        for start_frame in range(0, frame_count, frames_per_chunk)
+    ]
+    result = chord(header)(merge_video_analysis.s(record_id, video_start, fps, detection_type, video_path,
+                                                  confidence, scenarios, rules))
+
+    print(f"Video analysis of {video_path} split in {chunk_count} chunk(s) of {chunk_seconds}s, merge task {result.id}.")
+    return {"chunks": chunk_count, "merge_task_id": result.id}
+
+
+globals()['run_video_analysis'] = run_video_analysis
@@ -0,0 +1,195 @@
+#camerahealth.py
+import argparse
+import os
+import socket
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from app.capture import OPEN_TIMEOUT_SECONDS, backoff_delay, open_capture
+from app.redisclient import get_redis
+
+# Consecutive failed connects to a camera, counted across all its streams, that open its circuit.
+# 0 disables the breaker.
+CAMERA_CIRCUIT_FAILURES = int(os.getenv("CAMERA_CIRCUIT_FAILURES", 3))
+# Seconds between two registry lookups of a parked stream
+CAMERA_PARK_POLL = float(os.getenv("CAMERA_PARK_POLL", 5))
+# Backoff of the prober on a camera that stays down
+CAMERA_PROBE_BASE_DELAY = float(os.getenv("CAMERA_PROBE_BASE_DELAY", 5))
+CAMERA_PROBE_MAX_DELAY = float(os.getenv("CAMERA_PROBE_MAX_DELAY", 300))
+CAMERA_PROBE_TIMEOUT = float(os.getenv("CAMERA_PROBE_TIMEOUT", 3))
+
+# Cameras with an open circuit, scored by the time of their next probe
+OPEN_CAMERAS_KEY = "camerahealth:open"
+PROBER_LOCK_KEY = "camerahealth:prober"
+# Lifetime of the prober lock, renewed before every probe so a long pass never outlives it
+PROBER_LOCK_SECONDS = int(os.getenv("CAMERA_PROBER_LOCK_SECONDS", 30))
+# Lock operations that only act when the lock still holds the caller's token
+RENEW_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end
+return 0
+"""
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+# Ports probed when the camera URL has none
+DEFAULT_PORTS = {"rtsp": 554, "rtsps": 322, "rtmp": 1935, "http": 80, "https": 443}
+
+
+def health_key(camera_id):
+    return f"camerahealth:{camera_id}"
+
+
+def report_failure(camera_id, source, backend=None):
+    """Count a failed connect to the camera, returns True when its circuit is open."""
+    if not CAMERA_CIRCUIT_FAILURES:
+        return False
+    try:
+        client = get_redis()
+        key = health_key(camera_id)
+        failures = client.hincrby(key, "failures", 1)
+        if failures < CAMERA_CIRCUIT_FAILURES:
+            return False
+
+        pipe = client.pipeline()
+        pipe.hset(key, mapping={"state": "open", "source": source, "backend": backend or ""})
+        pipe.hsetnx(key, "opened", time.time())
+        # nx: the first stream to give up schedules the probe, the others do not push it back
+        pipe.zadd(OPEN_CAMERAS_KEY, {camera_id: time.time() + CAMERA_PROBE_BASE_DELAY}, nx=True)
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Error updating camera health: {e}")
+        return False
+
+
+def report_success(camera_id):
+    """Close the circuit of a camera that could be reached."""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hset(health_key(camera_id), mapping={"state": "closed", "failures": 0, "probes": 0})
+        pipe.hdel(health_key(camera_id), "opened")
+        pipe.zrem(OPEN_CAMERAS_KEY, camera_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"Error updating camera health: {e}")
+
+
+def circuit_open(camera_id):
+    # Without the registry every camera is treated as healthy, the streams then retry on their own
+    try:
+        return get_redis().hget(health_key(camera_id), "state") == b"open"
+    except Exception as e:
+        print(f"Error reading camera health: {e}")
+        return False
+
+
+def wait_until_healthy(camera_id, poll=CAMERA_PARK_POLL):
+    """
+    Park while the circuit of the camera is open: one registry lookup every poll seconds, no
+    connect attempts. Returns the seconds spent parked.
+    """
+    if not circuit_open(camera_id):
+        return 0.0
+
+    started = time.monotonic()
+    print(f"Circuit of camera {camera_id} is open, parking until the prober reaches it.")
+    while circuit_open(camera_id):
+        time.sleep(poll)
+
+    parked = time.monotonic() - started
+    print(f"Camera {camera_id} is healthy again after {parked:.0f}s, resuming.")
+    return parked
+
+
+def probe(source, backend=None, timeout=CAMERA_PROBE_TIMEOUT):
+    """
+    Whether the camera answers. Network cameras only get a TCP connect, which is enough to tell a
+    dead segment from a live one without an RTSP session or a decoder; anything else is opened.
+    """
+    url = urlsplit(str(source))
+    port = url.port if url.hostname and url.port else DEFAULT_PORTS.get(url.scheme)
+    if url.hostname and port and url.scheme != "udp":
+        try:
+            with socket.create_connection((url.hostname, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    cap = open_capture(source, backend or None)
+    try:
+        return cap.isOpened()
+    finally:
+        cap.release()
+
+
+def probe_open_cameras(lock_seconds=PROBER_LOCK_SECONDS):
+    """
+    One prober pass over the cameras whose probe is due. A healthy camera has its circuit closed,
+    which resumes its parked streams; a camera still down is probed again after a growing delay.
+    Returns (probed, recovered).
+    """
+    client = get_redis()
+    # A single prober across the fleet, an overlapping run skips its turn. The token makes sure a
+    # pass only ever renews or releases its own lock.
+    token = uuid.uuid4().hex
+    if not client.set(PROBER_LOCK_KEY, token, nx=True, ex=lock_seconds):
+        return 0, 0
+    renew_lock = client.register_script(RENEW_LOCK_SCRIPT)
+    release_lock = client.register_script(RELEASE_LOCK_SCRIPT)
+    # Twice the slowest probe, a TCP connect or a capture open, so the lock outlives the next probe
+    probe_lock_seconds = max(lock_seconds, int(2 * max(CAMERA_PROBE_TIMEOUT, OPEN_TIMEOUT_SECONDS)) + 1)
+
+    probed = recovered = 0
+    try:
+        for member in client.zrangebyscore(OPEN_CAMERAS_KEY, 0, time.time()):
+            if not renew_lock(keys=[PROBER_LOCK_KEY], args=[token, probe_lock_seconds]):
+                print("Camera prober lost its lock, leaving the rest of the pass to the next prober.")
+                break
+            camera_id = int(member)
+            health = client.hgetall(health_key(camera_id))
+            if health.get(b"state") != b"open":
+                client.zrem(OPEN_CAMERAS_KEY, camera_id)
+                continue
+
+            probed += 1
+            if probe(health[b"source"].decode(), health.get(b"backend", b"").decode()):
+                report_success(camera_id)
+                recovered += 1
+                print(f"Camera {camera_id} answers again, circuit closed.")
+                continue
+
+            probes = client.hincrby(health_key(camera_id), "probes", 1)
+            delay = CAMERA_PROBE_BASE_DELAY + backoff_delay(probes, CAMERA_PROBE_BASE_DELAY, CAMERA_PROBE_MAX_DELAY)
+            client.zadd(OPEN_CAMERAS_KEY, {camera_id: time.time() + delay})
+    finally:
+        release_lock(keys=[PROBER_LOCK_KEY], args=[token])
+    return probed, recovered
+
+
+def read_camera_health():
+    """camera id -> registry entry of every camera that failed at least once."""
+    client = get_redis()
+    health = {}
+    for key in client.scan_iter(health_key("*")):
+        suffix = key.decode().rsplit(":", 1)[1]
+        if suffix.isdigit():
+            health[int(suffix)] = {field.decode(): value.decode() for field, value in client.hgetall(key).items()}
+    return health
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the camera health registry, or close the circuit of cameras.")
+    parser.add_argument("--close", type=int, nargs="*", default=[], metavar="CAMERA_ID",
+                        help="mark cameras healthy, e.g. after fixing their network by hand")
+    args = parser.parse_args()
+
+    for camera_id in args.close:
+        report_success(camera_id)
+    next_probes = dict(get_redis().zrange(OPEN_CAMERAS_KEY, 0, -1, withscores=True))
+    for camera_id, health in sorted(read_camera_health().items()):
+        due = next_probes.get(str(camera_id).encode())
+        due = f", next probe in {max(0, due - time.time()):.0f}s" if due else ""
+        print(f"camera {camera_id}: {health.get('state', 'closed')}, {health.get('failures', 0)} failure(s), "
+              f"{health.get('probes', 0)} probe(s){due}")
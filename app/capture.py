@@ -0,0 +1,267 @@
+#capture.py
+import os
+import random
+import select
+import subprocess
+import time
+import cv2
+import numpy as np
+
+# Capture backends a camera can be configured with
+OPENCV_BACKEND = "opencv"
+FFMPEG_BACKEND = "ffmpeg"
+# Frames decoded by a separate capture process and shared through app.framebus
+FRAMEBUS_BACKEND = "framebus"
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+# Frames per second kept by ffmpeg, 10 matches the 0.1 s pacing of the stream tasks
+FFMPEG_CAPTURE_FPS = float(os.getenv("FFMPEG_CAPTURE_FPS", 10))
+# Optional hardware decoder, e.g. "cuda", "vaapi" or "qsv"
+FFMPEG_HWACCEL = os.getenv("FFMPEG_HWACCEL")
+
+# Size of the frames delivered by the ffmpeg capture backend
+FRAME_SIZE = (640, 480)
+
+# A read or connect that takes longer than this is treated as a dead stream
+OPEN_TIMEOUT_SECONDS = float(os.getenv("CAPTURE_OPEN_TIMEOUT", 10))
+READ_TIMEOUT_SECONDS = float(os.getenv("CAPTURE_READ_TIMEOUT", 10))
+# Reconnect backoff bounds
+RECONNECT_BASE_DELAY = float(os.getenv("CAPTURE_RECONNECT_BASE_DELAY", 0.5))
+RECONNECT_MAX_DELAY = float(os.getenv("CAPTURE_RECONNECT_MAX_DELAY", 30))
+
+
+def backoff_delay(attempt, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+    """Exponential backoff with full jitter, so streams cut by the same outage do not reconnect in lockstep."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def open_capture(source, backend=None):
+    if backend == FFMPEG_BACKEND:
+        return FFmpegCapture(source, *FRAME_SIZE)
+    # The ffmpeg backend of OpenCV would otherwise wait forever on a hung RTSP session
+    return cv2.VideoCapture(source, cv2.CAP_FFMPEG, [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(OPEN_TIMEOUT_SECONDS * 1000),
+        cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(READ_TIMEOUT_SECONDS * 1000),
+    ])
+
+
+class FFmpegCapture:
+    """
+    Drop-in replacement for cv2.VideoCapture that lets ffmpeg drop frames, scale and convert to BGR
+    before the frames leave the decoder process. Raw frames are read from the pipe into one
+    preallocated buffer, so read() returns the same array every time: copy it if it must outlive
+    the next read.
+    """
+
+    def __init__(self, source, width, height, fps=FFMPEG_CAPTURE_FPS):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+        self._buffer = memoryview(self.frame).cast('B')
+        self._process = None
+        self._has_pending_frame = False
+        self._open()
+
+    def _command(self):
+        command = [FFMPEG_PATH, '-nostdin', '-hide_banner', '-loglevel', 'error']
+        if FFMPEG_HWACCEL:
+            command += ['-hwaccel', FFMPEG_HWACCEL]
+        if str(self.source).startswith('rtsp://'):
+            command += ['-rtsp_transport', 'tcp', '-fflags', 'nobuffer', '-flags', 'low_delay',
+                        '-timeout', str(int(READ_TIMEOUT_SECONDS * 1_000_000))]
+
+        # Keep the aspect ratio and pad, the letterbox preprocessing then only has to scale once
+        filters = (f'scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,'
+                   f'pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2')
+        if self.fps:
+            # Drop frames before scaling so only the kept frames are converted
+            filters = f'fps={self.fps},{filters}'
+
+        command += ['-i', str(self.source), '-an', '-sn', '-vf', filters,
+                    '-pix_fmt', 'bgr24', '-f', 'rawvideo', 'pipe:1']
+        return command
+
+    def _open(self):
+        try:
+            self._process = subprocess.Popen(self._command(), stdout=subprocess.PIPE, bufsize=0)
+        except OSError as e:
+            print(f"Failed to start ffmpeg for {self.source}: {e}")
+            self._process = None
+            return
+
+        # ffmpeg only fails once it tries to read the source, so the first frame decides whether we are open
+        self._has_pending_frame = self._read_into_buffer(OPEN_TIMEOUT_SECONDS)
+        if not self._has_pending_frame:
+            self.release()
+
+    def _read_into_buffer(self, timeout=READ_TIMEOUT_SECONDS):
+        size = len(self._buffer)
+        received = 0
+        while received < size:
+            # A hung source leaves ffmpeg alive but silent, do not block on the pipe forever
+            ready, _, _ = select.select([self._process.stdout], [], [], timeout)
+            if not ready:
+                print(f"No data from ffmpeg for {self.source} in {timeout}s.")
+                return False
+            count = self._process.stdout.readinto(self._buffer[received:])
+            if not count:
+                return False
+            received += count
+        return True
+
+    def isOpened(self):
+        return self._process is not None
+
+    def read(self):
+        if self._process is None:
+            return False, None
+
+        if self._has_pending_frame:
+            self._has_pending_frame = False
+            return True, self.frame
+
+        if not self._read_into_buffer():
+            return False, None
+        return True, self.frame
+
+    def grab(self):
+        ret, _ = self.read()
+        return ret
+
+    def release(self):
+        if self._process is None:
+            return
+
+        self._process.kill()
+        self._process.stdout.close()
+        self._process.wait()
+        self._process = None
+
+
+class ResilientStream:
+    """
+    Frame source that survives camera outages without leaving the task loop. A failed or timed-out
+    read reconnects in place with jittered exponential backoff, so the model, debounce state and
+    DB session of the task stay warm. sources is a list of (source, source_type) tried in order.
+    With a camera_id the first source is that camera: its connects feed the camera health registry
+    and, once its circuit is open, the stream parks until the prober finds it healthy.
+    """
+
+    def __init__(self, sources, backend=None, max_attempts=None, camera_id=None):
+        self.camera_source = sources[0][0] if camera_id is not None and sources else None
+        self.sources = [(source, source_type) for source, source_type in sources if source is not None]
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.camera_id = camera_id if self.camera_source is not None else None
+        self.cap = None
+        self.source = None
+        self.stats = {
+            "frames": 0,
+            "reconnects": 0,
+            "last_reconnect_seconds": 0.0,
+            "total_reconnect_seconds": 0.0,
+            "parked_seconds": 0.0,
+        }
+        self._connected_at = None
+        self._first_position = None
+
+    def connect(self):
+        from app import camerahealth
+
+        attempt = 0
+        while True:
+            if self.camera_id is not None:
+                self.stats["parked_seconds"] += camerahealth.wait_until_healthy(self.camera_id)
+
+            for source, source_type in self.sources:
+                cap = open_capture(source, self.backend)
+                if cap.isOpened():
+                    print(f"Connected to {source_type} at {source} after {attempt + 1} attempt(s).")
+                    if self.camera_id is not None and source == self.camera_source:
+                        camerahealth.report_success(self.camera_id)
+                    self.cap, self.source = cap, source
+                    self._connected_at, self._first_position = None, None
+                    return
+                cap.release()
+                if self.camera_id is not None and source == self.camera_source \
+                        and camerahealth.report_failure(self.camera_id, source, self.backend):
+                    # The camera is known down: park instead of the fallbacks and further retries
+                    break
+            else:
+                if self.max_attempts is not None and attempt + 1 >= self.max_attempts:
+                    raise RuntimeError("Could not open IP camera or video file after retrying.")
+
+                delay = backoff_delay(attempt)
+                print(f"Failed to connect to any source. Retrying in {delay:.1f}s... ({attempt + 1})")
+                time.sleep(delay)
+                attempt += 1
+
+    def reconnect(self):
+        started = time.monotonic()
+        self.release()
+        self.connect()
+
+        elapsed = time.monotonic() - started
+        self.stats["reconnects"] += 1
+        self.stats["last_reconnect_seconds"] = elapsed
+        self.stats["total_reconnect_seconds"] += elapsed
+        print(f"Reconnected to {self.source} in {elapsed:.2f}s (reconnect #{self.stats['reconnects']}).")
+
+    def read(self):
+        if self.cap is None:
+            self.connect()
+
+        while True:
+            ret, frame = self.cap.read()
+            if ret:
+                self.stats["frames"] += 1
+                if self._connected_at is None:
+                    self._connected_at, self._first_position = time.monotonic(), self.position_seconds()
+                return frame
+            print(f"Failed to capture frame from {self.source}, reconnecting.")
+            self.reconnect()
+
+    def position_seconds(self):
+        """Media time of the last frame read, None when the backend cannot tell."""
+        if not hasattr(self.cap, 'get'):
+            return None
+        position = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        return position / 1000 if position > 0 else None
+
+    def lag_seconds(self):
+        """How far the reader is behind a real-time source: wall time elapsed minus media time consumed."""
+        if self._connected_at is None or self._first_position is None:
+            return None
+        position = self.position_seconds()
+        if position is None:
+            return None
+        return (time.monotonic() - self._connected_at) - (position - self._first_position)
+
+    def frame_position(self):
+        """Index of the next frame when reading a file, None for live sources."""
+        if self.cap is None or not os.path.isfile(str(self.source)) or not hasattr(self.cap, 'get'):
+            return None
+        return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def seek(self, frame_position):
+        """Continue a file source at frame_position, live sources ignore it."""
+        if self.cap is None:
+            self.connect()
+        if os.path.isfile(str(self.source)) and hasattr(self.cap, 'set'):
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_position)
+
+    def grab(self):
+        if self.cap is None:
+            self.connect()
+
+        while not self.cap.grab():
+            print(f"Failed to capture frame from {self.source}, reconnecting.")
+            self.reconnect()
+        self.stats["frames"] += 1
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
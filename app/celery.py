@@ -1,19 +1,54 @@
 import multiprocessing
 import os
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_init, worker_process_init
+from kombu import Queue
 
 multiprocessing.set_start_method('fork', force=True)
 
+# Queue names. Streams are infinite detection loops, jobs are bounded work (reports, exports, ...)
+STREAMS_QUEUE = os.getenv("CELERY_STREAMS_QUEUE", "streams-queue")
+JOBS_QUEUE = os.getenv("CELERY_JOBS_QUEUE", "jobs-queue")
+# Camera health probes, consumed by the beat profile so long jobs never hold them up
+HEALTH_QUEUE = os.getenv("CELERY_HEALTH_QUEUE", "health-queue")
+# Kept so producers that still publish to the old queue are served by the streams profile
+LEGACY_QUEUE = "main-queue"
+
+# Options shared by every long-running stream task: ack only once the task ends so a killed
+# worker hands the stream back to the broker, and never store a result for an infinite loop
+STREAM_TASK_OPTIONS = {
+    "acks_late": True,
+    "reject_on_worker_lost": True,
+    "ignore_result": True,
+}
+
+# Modules holding the tasks. Only the worker imports them, producers send tasks by name
+# (see app.client) and never pull in cv2, torch or ultralytics.
+TASK_MODULES = ['app.ppetask', 'app.palletstask', 'app.forklifttask', 'app.streamtask', 'app.batchtask', 'app.retentiontask', 'app.notifytask', 'app.probetask', 'app.exporttask']
+
 # Initialize Celery application
 celery_app = Celery(
     "detection_tasks",
     broker=os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"),
-    backend=os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
+    backend=os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0"),
+    include=TASK_MODULES,
 )
 
 # Celery configurations
+celery_app.conf.task_queues = (
+    Queue(STREAMS_QUEUE),
+    Queue(JOBS_QUEUE),
+    Queue(HEALTH_QUEUE),
+    Queue(LEGACY_QUEUE),
+)
+celery_app.conf.task_default_queue = JOBS_QUEUE
 celery_app.conf.task_routes = {
-    "app.worker.detection_tasks": "main-queue",
+    "app.ppetask.run_ppe_detection": {"queue": STREAMS_QUEUE},
+    "app.palletstask.run_pallet_detection": {"queue": STREAMS_QUEUE},
+    "app.forklifttask.run_proximity_detection": {"queue": STREAMS_QUEUE},
+    "app.streamtask.run_rule_detection": {"queue": STREAMS_QUEUE},
+    "app.probetask.probe_camera_health": {"queue": HEALTH_QUEUE},
 }
 celery_app.conf.update(
     task_serializer="json",
@@ -21,11 +56,81 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    # With late acks the redis transport redelivers any message still unacked after the
+    # visibility timeout, which for an infinite stream would start a duplicate. Keep it
+    # well above the expected lifetime of a stream.
+    broker_transport_options={
+        "visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", 60 * 60 * 24 * 30)),
+    },
 )
 
-import app.ppetask
-import app.palletstask
-import app.forklifttask
+# Pool children above this size are replaced once their task ends. Streams never end on their own,
+# so they checkpoint and re-queue themselves when they cross it (see app.checkpoint).
+STREAM_RECYCLE_RSS_MB = int(os.getenv("STREAM_RECYCLE_RSS_MB", 0))
+if STREAM_RECYCLE_RSS_MB:
+    celery_app.conf.worker_max_memory_per_child = STREAM_RECYCLE_RSS_MB * 1024
+
+# Periodic jobs, run by `celery beat` (WORKER_PROFILE=beat) and executed on the jobs queue
+celery_app.conf.beat_schedule = {
+    "incident-retention": {
+        "task": "app.retentiontask.run_incident_retention",
+        "schedule": crontab(hour=int(os.getenv("RETENTION_HOUR_UTC", 2)), minute=0),
+    },
+    # Appends the new incidents to the Parquet export, before retention deletes any of them
+    "incident-export": {
+        "task": "app.exporttask.run_incident_export",
+        "schedule": crontab(hour=int(os.getenv("INCIDENT_EXPORT_HOUR_UTC", 1)), minute=0),
+    },
+    # Collects new incidents into per-assignee digests, sent at most every NOTIFY_MIN_INTERVAL
+    "incident-notifications": {
+        "task": "app.notifytask.collect_incident_notifications",
+        "schedule": float(os.getenv("NOTIFY_COLLECT_INTERVAL", 60)),
+    },
+    # The single prober of the cameras whose circuit is open (see app.camerahealth)
+    "camera-health-probe": {
+        "task": "app.probetask.probe_camera_health",
+        "schedule": float(os.getenv("CAMERA_PROBE_INTERVAL", 5)),
+        # A probe that waited longer than its interval is superseded by the next one
+        "options": {"expires": float(os.getenv("CAMERA_PROBE_INTERVAL", 5))},
+    },
+}
+
+
+@worker_init.connect
+def preload_detection_models(**kwargs):
+    """Opt-in (PRELOAD_MODELS=1): load every DetectionType model in the parent so children share it."""
+    if os.getenv("PRELOAD_MODELS", "0").lower() not in ("1", "true", "yes"):
+        return
+
+    from app import crud
+    from app.database import SessionLocal, engine
+    from app.modelcache import preload_models
+
+    db = SessionLocal()
+    try:
+        model_paths = [detection_type.modelpath for detection_type in crud.get_all_detection_types(db) if detection_type.modelpath]
+    finally:
+        db.close()
+        # Pooled connections must not be inherited by the children
+        engine.dispose()
+
+    from app.ppetask import PPE_TWO_STAGE, PERSON_MODEL_PATH
+    if PPE_TWO_STAGE:
+        model_paths.append(PERSON_MODEL_PATH)
+
+    preload_models(model_paths)
+
+
+@worker_init.connect
+def register_control_commands(**kwargs):
+    # Only the worker needs them, producers importing this module do not load celery.worker
+    import app.workercontrol  # noqa: F401
 
 
-celery_app.autodiscover_tasks(['app.ppetask', 'app.palletstask', 'app.forklifttask'])
+@worker_process_init.connect
+def init_detection_child(**kwargs):
+    from app.cpubudget import assign_budget, configured_concurrency
+    from app.modelcache import init_child_process
+    init_child_process()
+    # After init_child_process, which would otherwise reset the torch thread count
+    assign_budget(configured_concurrency())
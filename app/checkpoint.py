@@ -0,0 +1,119 @@
+#checkpoint.py
+import json
+import os
+import time
+from datetime import datetime
+
+from app.commontasks import detection_cache, frame_hash_cache
+from app.redisclient import get_redis
+
+# Seconds between two checkpoints of a stream, 0 disables checkpointing
+CHECKPOINT_INTERVAL = float(os.getenv("STREAM_CHECKPOINT_INTERVAL", 30))
+# A checkpoint older than this is ignored on restart, the stream state would be stale anyway
+CHECKPOINT_TTL = int(os.getenv("STREAM_CHECKPOINT_TTL", 60 * 60 * 24))
+# Resident memory in MB above which a stream checkpoints and hands itself to a fresh pool child,
+# 0 disables the watchdog
+STREAM_RECYCLE_RSS_MB = int(os.getenv("STREAM_RECYCLE_RSS_MB", 0))
+MEMORY_CHECK_INTERVAL = float(os.getenv("STREAM_MEMORY_CHECK_INTERVAL", 10))
+
+
+def checkpoint_key(record_id):
+    return f"streamcheckpoint:{record_id}"
+
+
+def rss_mb():
+    import psutil
+    return psutil.Process().memory_info().rss / 2**20
+
+
+class StreamCheckpoint:
+    """
+    Periodically saves what a stream needs to carry on where it stopped: the debounce timestamps
+    and frame hashes of its recording, the task's counters and, for file sources, the frame
+    position. A restarted or recycled stream restores it before its first frame.
+    """
+
+    def __init__(self, record_id, interval=CHECKPOINT_INTERVAL, recycle_rss_mb=STREAM_RECYCLE_RSS_MB):
+        self.record_id = record_id
+        self.interval = interval
+        self.recycle_rss_mb = recycle_rss_mb
+        self.prefix = f"{record_id}_"
+        self._last_save = time.monotonic()
+        self._last_memory_check = time.monotonic()
+
+    def state(self, stream, counters):
+        return {
+            "saved": time.time(),
+            "pid": os.getpid(),
+            "debounce": {key: timestamp.isoformat() for key, timestamp in list(detection_cache.items())
+                         if key.startswith(self.prefix) and timestamp is not None},
+            "frame_hashes": [[class_name, frame_hash, incident_id, stored_at.isoformat()]
+                             for (record_id, class_name), (frame_hash, incident_id, stored_at) in list(frame_hash_cache.items())
+                             if record_id == self.record_id],
+            "counters": counters,
+            "source": stream.source if hasattr(stream, "source") else None,
+            "frame_position": stream.frame_position(),
+        }
+
+    def save(self, stream, counters=None):
+        self._last_save = time.monotonic()
+        if not self.interval:
+            return
+        try:
+            get_redis().set(checkpoint_key(self.record_id), json.dumps(self.state(stream, counters or {})), ex=CHECKPOINT_TTL)
+        except Exception as e:
+            print(f"Error saving stream checkpoint: {e}")
+
+    def restore(self, stream):
+        """Load the last checkpoint into the caches and the stream, returns its counters ({} without one)."""
+        if not self.interval:
+            return {}
+        try:
+            value = get_redis().get(checkpoint_key(self.record_id))
+        except Exception as e:
+            print(f"Error loading stream checkpoint: {e}")
+            return {}
+        if value is None:
+            return {}
+
+        state = json.loads(value)
+        # Entries already in this process (a retry rather than a new child) are at least as recent
+        for key, timestamp in state["debounce"].items():
+            if detection_cache.get(key) is None:
+                detection_cache[key] = datetime.fromisoformat(timestamp)
+        for class_name, frame_hash, incident_id, stored_at in state["frame_hashes"]:
+            frame_hash_cache.setdefault((self.record_id, class_name), (frame_hash, incident_id, datetime.fromisoformat(stored_at)))
+
+        if state["frame_position"] is not None and state["source"] == getattr(stream, "source", None):
+            stream.seek(state["frame_position"])
+
+        age = time.time() - state["saved"]
+        print(f"Restored checkpoint of recording {self.record_id} from {age:.0f}s ago "
+              f"({len(state['debounce'])} debounce entries, position {state['frame_position']}).")
+        return state["counters"]
+
+    def update(self, stream, counters=None):
+        """Call once per loop iteration. Saves when due, returns True when the stream should be recycled."""
+        now = time.monotonic()
+        if self.interval and now - self._last_save >= self.interval:
+            self.save(stream, counters)
+
+        if not self.recycle_rss_mb or now - self._last_memory_check < MEMORY_CHECK_INTERVAL:
+            return False
+        self._last_memory_check = now
+        rss = rss_mb()
+        if rss < self.recycle_rss_mb:
+            return False
+
+        print(f"Stream of recording {self.record_id} uses {rss:.0f} MB (limit {self.recycle_rss_mb} MB), recycling.")
+        self.save(stream, counters)
+        return True
+
+
+def recycle_stream(task):
+    """
+    Queue the running stream task again under the same id and let the current one end, so the
+    pool child finishes its task and is replaced (worker_max_memory_per_child) before the stream
+    continues from its checkpoint. The same id keeps Recording.task_id valid for revoking.
+    """
+    task.apply_async(args=task.request.args, kwargs=task.request.kwargs, task_id=task.request.id)
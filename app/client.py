@@ -0,0 +1,85 @@
+#client.py
+import argparse
+import subprocess
+import sys
+
+from app.celery import celery_app
+
+# Registered names of the tasks, so producers can send them without importing the task modules
+PPE_TASK = "app.ppetask.run_ppe_detection"
+PALLET_TASK = "app.palletstask.run_pallet_detection"
+PROXIMITY_TASK = "app.forklifttask.run_proximity_detection"
+RULE_TASK = "app.streamtask.run_rule_detection"
+VIDEO_ANALYSIS_TASK = "app.batchtask.run_video_analysis"
+
+DETECTION_TASKS = {
+    "run_ppe_detection": PPE_TASK,
+    "run_pallet_detection": PALLET_TASK,
+    "run_proximity_detection": PROXIMITY_TASK,
+    "run_rule_detection": RULE_TASK,
+}
+
+HEAVY_MODULES = ("torch", "ultralytics", "cv2")
+
+
+def resolve_task_name(task_name):
+    """Accept either the short name stored in DetectionType.task_name or the registered name."""
+    return DETECTION_TASKS.get(task_name, task_name)
+
+
+def detection_signature(task_name, camera_id, model_path, record_id):
+    return celery_app.signature(resolve_task_name(task_name), args=(camera_id, model_path, record_id))
+
+
+def start_detection(task_name, camera_id, model_path, record_id):
+    """Start a detection stream, routed to the streams queue by the task routes of app.celery."""
+    return detection_signature(task_name, camera_id, model_path, record_id).apply_async()
+
+
+def start_video_analysis(detection_type, video_path, model_path, record_id, video_start=None):
+    return celery_app.send_task(VIDEO_ANALYSIS_TASK,
+                                args=(detection_type, video_path, model_path, record_id),
+                                kwargs={"video_start": video_start})
+
+
+def stop_detection(task_id):
+    celery_app.control.revoke(task_id, terminate=True)
+
+
+def profile_stream(record_id, seconds=30, timeout=5):
+    """Profile the stream of a recording on whichever worker runs it, returns the worker replies."""
+    return celery_app.control.broadcast("profile_stream", arguments={"record_id": record_id, "seconds": seconds},
+                                        reply=True, timeout=timeout)
+
+
+def profile_workers(seconds=30, destination=None, timeout=5):
+    """Profile every stream of the destination workers (all workers by default)."""
+    return celery_app.control.broadcast("profile_worker", arguments={"seconds": seconds},
+                                        destination=destination, reply=True, timeout=timeout)
+
+
+def measure_import(module):
+    """Import module in a fresh interpreter, returns the seconds it took and the heavy modules it loaded."""
+    code = (
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - started)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split("\n")
+    return float(output[0]), [m for m in output[1].split(",") if m]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare cold-start import time of the client and the task modules.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in ("app.client", "app.ppetask, app.palletstask, app.forklifttask"):
+        timings = []
+        for _ in range(args.runs):
+            seconds, heavy = measure_import(module)
+            timings.append(seconds)
+        timings.sort()
+        print(f"import {module}: median {timings[len(timings) // 2]:.3f}s, loads {', '.join(heavy) or 'no heavy modules'}")
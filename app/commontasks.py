@@ -1,50 +1,61 @@
-from collections import defaultdict
-from sqlalchemy import desc
-import cv2
+import os
+from collections import defaultdict, namedtuple
+from sqlalchemy import desc, func
+from app import crud
+from app.events import publish_incident
+from app.framehash import dhash, format_hash, hamming_distance, parse_hash
 from app.models import Incident
+from app.preprocess import scale_boxes_to_frame
+from app.capture import FRAMEBUS_BACKEND, ResilientStream
 from datetime import timezone
 
+# Detections of one frame as arrays: xyxy boxes in frame coordinates, confidences and class ids
+Detections = namedtuple("Detections", ["xyxy", "conf", "cls"])
+
 # Initialize a cache to store the last detection timestamp for each class and recording
 detection_cache = defaultdict(lambda: None)
 
-import cv2
-import time
-
-def initialize_camera(ip_cam_url=None, video_file_path=None, retries=3, delay=2):
-    cap = None
-    
-    def try_open_source(source, source_type):
-        for attempt in range(retries):
-            cap = cv2.VideoCapture(source)
-            if cap.isOpened():
-                print(f"Connected to {source_type} at {source} after {attempt + 1} attempt(s).")
-                return cap
-            else:
-                print(f"Failed to connect to {source_type} at {source}. Retrying... ({attempt + 1}/{retries})")
-                time.sleep(delay)
-        return None
-    
-    if ip_cam_url is not None:
-        cap = try_open_source(ip_cam_url, "IP camera")
-        if cap is not None:
-            return cap
-    
-    if video_file_path is not None:
-        cap = try_open_source(video_file_path, "video file")
-        if cap is not None:
-            return cap
-    
-    raise RuntimeError("Could not open IP camera or video file after retrying.")
+# Set INCIDENT_DEDUP=0 to store every incident frame
+INCIDENT_DEDUP = os.getenv("INCIDENT_DEDUP", "1").lower() not in ("0", "false", "no")
+# Differing bits (out of 64) up to which two frames show the same scene
+INCIDENT_DEDUP_DISTANCE = int(os.getenv("INCIDENT_DEDUP_DISTANCE", 6))
+# A stored frame is referenced for at most this many seconds, then a fresh one is kept
+INCIDENT_DEDUP_WINDOW = float(os.getenv("INCIDENT_DEDUP_WINDOW", 3600))
+
+# Last stored frame per (recording, class): (hash, id of the incident holding it, its timestamp)
+frame_hash_cache = {}
+
+
+def open_stream(ip_cam_url=None, video_file_path=None, backend=None, camera_id=None):
+    """Connect a ResilientStream to the camera, falling back to the video file while its circuit is closed."""
+    if backend == FRAMEBUS_BACKEND:
+        from app.framebus import FrameBusStream
+        stream = FrameBusStream(camera_id)
+        stream.connect()
+        return stream
 
+    stream = ResilientStream([(ip_cam_url, "IP camera"), (video_file_path, "video file")], backend=backend, camera_id=camera_id)
+    stream.connect()
+    return stream
 
 
+def detections_from_result(result, meta=None):
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy()
+    if meta is not None:
+        xyxy = scale_boxes_to_frame(xyxy, meta)
+    return Detections(xyxy, boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy().astype(int))
 
-def process_frame(cap):
-    ret, frame = cap.read()
-    if not ret:
-        raise OSError("Failed to capture frame from webcam")
-    frame = cv2.resize(frame, (640, 480))
-    return frame
+
+def detect(model, frame, preprocessor=None, options=None):
+    """Run the model on one frame, through the letterbox preprocessor when one is given. options go to the model call."""
+    options = options or {}
+    if preprocessor is None:
+        return detections_from_result(model(frame, **options)[0])
+
+    meta = preprocessor(frame)
+    results = model(preprocessor.tensor_batch(1), **options)
+    return detections_from_result(results[0], meta)
 
 
 def get_last_detection_timestamp(cache_key, db, record_id, class_name):
@@ -53,7 +64,7 @@ def get_last_detection_timestamp(cache_key, db, record_id, class_name):
 
     if not last_timestamp:
         # If not in cache, check the database
-        last_detection = db.query(Incident).filter_by(
+        last_detection = db.query(Incident.timestamp).filter_by(
             recording_id=record_id,
             class_name=class_name
         ).order_by(desc(Incident.timestamp)).first()
@@ -77,3 +88,76 @@ def should_skip_detection(cache_key, db, record_id, class_name, current_timestam
             return True
 
     return False
+
+
+def find_duplicate_frame(db, record_id, class_name, frame_hash, timestamp):
+    """Id of the incident holding a frame of the same scene for this recording and class, or None."""
+    key = (record_id, class_name)
+    last = frame_hash_cache.get(key)
+
+    if last is None:
+        stored = db.query(Incident.id, Incident.framehash, Incident.timestamp).filter(
+            Incident.recording_id == record_id,
+            Incident.class_name == class_name,
+            Incident.framehash.isnot(None),
+            Incident.frameref_id.is_(None),
+        ).order_by(desc(Incident.timestamp)).first()
+        if stored is None:
+            return None
+        last = frame_hash_cache[key] = (parse_hash(stored.framehash), stored.id, stored.timestamp)
+
+    last_hash, incident_id, stored_at = last
+    if stored_at.tzinfo is None:
+        stored_at = stored_at.replace(tzinfo=timezone.utc)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+    if (timestamp - stored_at).total_seconds() >= INCIDENT_DEDUP_WINDOW:
+        return None
+    if hamming_distance(frame_hash, last_hash) > INCIDENT_DEDUP_DISTANCE:
+        return None
+    return incident_id
+
+
+def save_incident(db, record_id, class_name, confidence, buffer, timestamp, frame=None, region=None, recording=None):
+    """
+    Store an incident and publish its event, returns the incident or None if it could not be saved.
+    With the annotated frame given, a repeat of the last stored scene (compared on region, the
+    whole frame by default) references that incident's frame instead of storing another JPEG.
+    recording (an events.RecordingInfo) describes the recording in the event, it is read from the
+    database when not given.
+    """
+    frame_hash = frame_ref = None
+    if frame is not None and INCIDENT_DEDUP:
+        frame_hash = dhash(frame, region)
+        frame_ref = find_duplicate_frame(db, record_id, class_name, frame_hash, timestamp)
+
+    db_detection = Incident(
+        recording_id=record_id,
+        class_name=class_name,
+        confidence=confidence,
+        bbox='',
+        frame=buffer.tobytes() if frame_ref is None else None,
+        framehash=format_hash(frame_hash) if frame_hash is not None else None,
+        frameref_id=frame_ref,
+        timestamp=timestamp
+    )
+
+    try:
+        db.add(db_detection)
+        if frame_ref is not None:
+            db.query(Incident).filter(Incident.id == frame_ref).update(
+                {Incident.occurrences: func.coalesce(Incident.occurrences, 1) + 1}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        print(f"Error saving to DB: {e}")
+        db.rollback()
+        return None
+
+    if frame_ref is not None:
+        print(f"{class_name} frame matches incident {frame_ref}, stored as a reference.")
+    elif frame_hash is not None:
+        frame_hash_cache[(record_id, class_name)] = (frame_hash, db_detection.id, timestamp)
+
+    publish_incident(db_detection, recording or crud.get_recording(db=db, recording_id=record_id))
+    return db_detection
@@ -0,0 +1,47 @@
+#confirmation.py
+import os
+
+# A violation must be seen in INCIDENT_CONFIRM_FRAMES of the last INCIDENT_CONFIRM_WINDOW processed
+# frames before it raises an incident. 1 of 1 raises on the first frame.
+INCIDENT_CONFIRM_FRAMES = int(os.getenv("INCIDENT_CONFIRM_FRAMES", 3))
+INCIDENT_CONFIRM_WINDOW = int(os.getenv("INCIDENT_CONFIRM_WINDOW", 5))
+
+
+class TemporalConfirmation:
+    """
+    k-of-n confirmation per key (a class name, or a track id once there is a tracker). Each key
+    keeps an int used as a rolling bitset of the last n processed frames, bit 0 being the newest.
+    Keys whose window is all zeros are dropped, so the state stays as small as what is in view.
+    """
+
+    def __init__(self, k=INCIDENT_CONFIRM_FRAMES, n=INCIDENT_CONFIRM_WINDOW):
+        if not 1 <= k <= n:
+            raise ValueError(f"Confirmation needs 1 <= k <= n, got {k} of {n}")
+        self.k = k
+        self.n = n
+        self.mask = (1 << n) - 1
+        self.bits = {}
+        self.suppressed = 0
+
+    def observe(self, present):
+        """Record one processed frame in which the keys in present were seen, returns the confirmed ones."""
+        present = set(present)
+        for key in present | self.bits.keys():
+            bits = ((self.bits.get(key, 0) << 1) | (key in present)) & self.mask
+            if bits:
+                self.bits[key] = bits
+            else:
+                del self.bits[key]
+
+        confirmed = {key for key in present if bin(self.bits[key]).count("1") >= self.k}
+        self.suppressed += len(present) - len(confirmed)
+        return confirmed
+
+    def state(self):
+        return {"bits": self.bits, "suppressed": self.suppressed}
+
+    def load(self, state):
+        """Continue from a checkpointed state()."""
+        if state:
+            self.bits.update({key: bits & self.mask for key, bits in state["bits"].items()})
+            self.suppressed = state["suppressed"]
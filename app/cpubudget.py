@@ -0,0 +1,155 @@
+#cpubudget.py
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import cv2
+
+# Set CPU_BUDGET=0 to leave affinity and thread counts to torch/OpenCV defaults
+CPU_BUDGET_ENABLED = os.getenv("CPU_BUDGET", "1").lower() not in ("0", "false", "no")
+# How often a running stream checks whether the pool size changed
+REBALANCE_INTERVAL = float(os.getenv("CPU_BUDGET_REBALANCE_INTERVAL", 30))
+
+_current_budget = None
+_last_check = 0.0
+
+
+def available_cores():
+    """Cores the worker parent may run on, our own affinity is already narrowed after the first budget."""
+    import psutil
+    try:
+        return sorted(psutil.Process(os.getppid()).cpu_affinity())
+    except (psutil.Error, AttributeError):
+        return sorted(os.sched_getaffinity(0))
+
+
+def pool_layout(configured_size=None):
+    """(index, size) of this process in its prefork pool."""
+    import psutil
+    siblings = sorted(child.pid for child in psutil.Process(os.getppid()).children())
+    position = siblings.index(os.getpid()) if os.getpid() in siblings else 0
+
+    try:
+        from billiard.process import current_process
+        index = current_process().index
+    except (ImportError, AttributeError):
+        index = None
+    if index is None:
+        index = position
+
+    # The pool spawns its children one by one, the first ones only see part of the pool
+    size = max(len(siblings), configured_size or 0, index + 1)
+    return index, size
+
+
+def split_cores(cores, index, size):
+    """Contiguous share of cores for child index out of size. More children than cores share round-robin."""
+    if size >= len(cores):
+        return [cores[index % len(cores)]]
+
+    per_child, extra = divmod(len(cores), size)
+    start = index * per_child + min(index, extra)
+    return cores[start:start + per_child + (1 if index < extra else 0)]
+
+
+def apply_budget(cores):
+    threads = len(cores)
+    os.sched_setaffinity(0, cores)
+    # Read by OpenMP/MKL when they initialise, i.e. by torch on its first use
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    cv2.setNumThreads(threads)
+    if "torch" in sys.modules:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def assign_budget(configured_size=None):
+    """Give this pool child its share of the cores, called from worker_process_init."""
+    global _current_budget, _last_check
+    if not CPU_BUDGET_ENABLED:
+        return None
+
+    index, size = pool_layout(configured_size)
+    cores = split_cores(available_cores(), index, size)
+    if (index, size, cores) != _current_budget:
+        apply_budget(cores)
+        print(f"Pool child {index}/{size} (pid {os.getpid()}) pinned to cores {cores}.")
+        _current_budget = (index, size, cores)
+    _last_check = time.monotonic()
+    return cores
+
+
+def maybe_rebalance():
+    """
+    Cheap enough to call every frame: re-splits the cores when the pool grew or shrank. Like the
+    first budget it counts at least the configured concurrency, a child being replaced (recycling,
+    max tasks or memory per child) is missing for a moment and must not re-split its siblings.
+    """
+    if _current_budget is None or time.monotonic() - _last_check < REBALANCE_INTERVAL:
+        return
+    assign_budget(configured_concurrency())
+
+
+def configured_concurrency():
+    value = os.getenv("WORKER_CONCURRENCY")
+    return int(value) if value else None
+
+
+def _benchmark_process(model_path, video_path, cores, seconds, counter):
+    from app.commontasks import detect
+    from app.modelcache import get_model
+    from app.preprocess import LetterboxPreprocessor, model_input_size
+
+    if cores is not None:
+        apply_budget(cores)
+    model = get_model(model_path)
+    preprocessor = LetterboxPreprocessor(model_input_size(model))
+    cap = cv2.VideoCapture(video_path)
+
+    frames = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        ret, frame = cap.read()
+        if not ret:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        detect(model, frame, preprocessor)
+        frames += 1
+
+    with counter.get_lock():
+        counter.value += frames
+
+
+def benchmark_layout(model_path, video_path, processes, threads, seconds):
+    """Aggregate FPS of processes concurrent streams, threads cores each (None: no budget)."""
+    cores = sorted(os.sched_getaffinity(0))
+    counter = multiprocessing.Value('l', 0)
+    workers = []
+    for index in range(processes):
+        budget = None if threads is None else split_cores(cores[:processes * threads], index, processes)
+        workers.append(multiprocessing.Process(target=_benchmark_process,
+                                               args=(model_path, video_path, budget, seconds, counter)))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return counter.value / seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare aggregate inference FPS across core budget layouts.")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--video", default="./yolomodels/testvideo.mp4")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--layouts", default="4xall,4x1,2x2,1x4",
+                        help="processes x cores per process, 'all' runs without a budget (default threads)")
+    args = parser.parse_args()
+
+    print(f"{len(os.sched_getaffinity(0))} cores available")
+    for layout in args.layouts.split(","):
+        processes, threads = layout.split("x")
+        threads = None if threads == "all" else int(threads)
+        fps = benchmark_layout(args.model, args.video, int(processes), threads, args.seconds)
+        print(f"{layout:>8}: {fps:7.1f} fps aggregate, {fps / int(processes):6.1f} fps per stream")
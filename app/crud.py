@@ -3,8 +3,10 @@ from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from app import schemas
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy import func
+from sqlalchemy import and_, func, or_
+from typing import Optional
 import datetime
+import json
 from datetime import timedelta
 from sqlalchemy.sql import text
 
@@ -45,7 +47,7 @@ def create_zone(db: Session, new_zone: schemas.CreateZone):
     zonecameras = []
     if len(new_zone.cameras) > 0:
         for cam in new_zone.cameras:
-            zonecameras.append(models.Camera(name=cam.name, description=cam.description, ipaddress=cam.ipaddress))
+            zonecameras.append(models.Camera(name=cam.name, description=cam.description, ipaddress=cam.ipaddress, capturebackend=cam.capturebackend.value))
     
     db_zone = models.Zone(title=new_zone.title, 
                           description=new_zone.description, 
@@ -230,6 +232,33 @@ def get_detection_model_by_id(db: Session, detection_type_id: int):
     return db.query(models.DetectionType).get(detection_type_id)
 
 
+def update_inference_profile(db: Session, detection_type_id: int, profile: schemas.InferenceProfile):
+    db_detection_type = db.query(models.DetectionType).get(detection_type_id)
+    if db_detection_type:
+        for field, value in profile.model_dump().items():
+            setattr(db_detection_type, field, value)
+        db.commit()
+        db.refresh(db_detection_type)
+        return db_detection_type
+    else:
+        return None
+
+
+def update_detection_rules(db: Session, detection_type_id: int, rules: schemas.DetectionRules):
+    from app.rules import build_rules
+
+    # Refuse a config the streams could not build
+    build_rules(rules.rules)
+    db_detection_type = db.query(models.DetectionType).get(detection_type_id)
+    if db_detection_type:
+        db_detection_type.rules = json.dumps(rules.rules)
+        db.commit()
+        db.refresh(db_detection_type)
+        return db_detection_type
+    else:
+        return None
+
+
 def get_report_data(db: Session, plant_id: int, zone_id: int, days: int, detection_type_id: int):
      # Filter by date range
     start_date = datetime.datetime.now() - timedelta(days=days)
@@ -290,3 +319,52 @@ def get_report_data(db: Session, plant_id: int, zone_id: int, days: int, detecti
         "incidents_timeline": incidents_timeline_data
     }
 
+
+
+def encode_incident_cursor(incident):
+    return f"{incident.timestamp.isoformat()}|{incident.id}"
+
+def decode_incident_cursor(cursor: str):
+    timestamp, incident_id = cursor.rsplit('|', 1)
+    return datetime.datetime.fromisoformat(timestamp), int(incident_id)
+
+def get_incidents_page(db: Session, recording_id: int, limit: int = 100, cursor: Optional[str] = None):
+    """
+    Newest-first page of incidents without their frames, with keyset pagination on (timestamp, id).
+    Returns the incidents and the cursor of the next page, None on the last page.
+    """
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1, got {limit}")
+
+    query = db.query(models.Incident).filter(models.Incident.recording_id == recording_id)
+
+    if cursor:
+        timestamp, incident_id = decode_incident_cursor(cursor)
+        query = query.filter(or_(
+            models.Incident.timestamp < timestamp,
+            and_(models.Incident.timestamp == timestamp, models.Incident.id < incident_id)
+        ))
+
+    incidents = query.order_by(models.Incident.timestamp.desc(), models.Incident.id.desc()).limit(limit + 1).all()
+
+    next_cursor = encode_incident_cursor(incidents[limit - 1]) if len(incidents) > limit else None
+    return incidents[:limit], next_cursor
+
+def iter_incidents(db: Session, recording_id: Optional[int] = None, since: Optional[datetime.datetime] = None, chunk_size: int = 1000):
+    """Stream incidents without their frames in chunks, memory stays flat whatever the result size."""
+    query = db.query(models.Incident)
+    if recording_id is not None:
+        query = query.filter(models.Incident.recording_id == recording_id)
+    if since is not None:
+        query = query.filter(models.Incident.timestamp >= since)
+
+    return query.order_by(models.Incident.timestamp, models.Incident.id).yield_per(chunk_size)
+
+def get_incident_frame(db: Session, incident_id: int) -> Optional[bytes]:
+    row = db.query(models.Incident.frame, models.Incident.frameref_id).filter(models.Incident.id == incident_id).first()
+    if row is None:
+        return None
+    # Deduplicated incidents point at the incident holding their frame
+    if row.frame is None and row.frameref_id is not None:
+        return get_incident_frame(db, row.frameref_id)
+    return row.frame
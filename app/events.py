@@ -0,0 +1,151 @@
+#events.py
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import timezone
+
+from app.redisclient import get_redis
+
+# Stream every saved incident is published to
+INCIDENT_STREAM = os.getenv("INCIDENT_EVENTS_STREAM", "incidents")
+# redis, local (in-process, for tests) or none
+INCIDENT_EVENTS_BROKER = os.getenv("INCIDENT_EVENTS_BROKER", "redis")
+INCIDENT_EVENTS_URL = os.getenv("INCIDENT_EVENTS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+# Approximate number of events kept in the stream, older ones are trimmed on publish
+INCIDENT_STREAM_MAXLEN = int(os.getenv("INCIDENT_EVENTS_MAXLEN", 100000))
+# Where consumers fetch the frame of an incident, {id} is the incident id
+INCIDENT_THUMBNAIL_URL = os.getenv("INCIDENT_THUMBNAIL_URL", "/incidents/{id}/frame")
+
+# The recording fields of an event. A stream keeps one for its whole run, a Recording row would
+# be expired by every commit and read again on the next publish.
+RecordingInfo = namedtuple("RecordingInfo", ["camera_id", "zone_id"])
+
+
+def incident_event(incident, recording):
+    """Small, frame-free description of a saved incident."""
+    timestamp = incident.timestamp
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+    return {
+        "incident_id": incident.id,
+        "recording_id": incident.recording_id,
+        "camera_id": recording.camera_id if recording else None,
+        "zone_id": recording.zone_id if recording else None,
+        "class_name": incident.class_name,
+        "confidence": incident.confidence,
+        "timestamp": timestamp.isoformat(),
+        "thumbnail": INCIDENT_THUMBNAIL_URL.format(id=incident.id),
+    }
+
+
+class RedisEventBroker:
+    """Incident events on a Redis stream, consumed through consumer groups."""
+
+    def __init__(self, url=INCIDENT_EVENTS_URL, stream=INCIDENT_STREAM, maxlen=INCIDENT_STREAM_MAXLEN):
+        self.client = get_redis(url)
+        self.stream = stream
+        self.maxlen = maxlen
+
+    def publish(self, event):
+        return self.client.xadd(self.stream, {"event": json.dumps(event)},
+                                maxlen=self.maxlen, approximate=True).decode()
+
+    def create_group(self, group, start_id="$"):
+        import redis
+
+        try:
+            self.client.xgroup_create(self.stream, group, id=start_id, mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read_group(self, group, consumer, count=100, block_ms=5000):
+        """Events not yet delivered to the group, as (event id, event) pairs."""
+        response = self.client.xreadgroup(group, consumer, {self.stream: ">"}, count=count, block=block_ms)
+        events = []
+        for _, messages in response or []:
+            for event_id, fields in messages:
+                events.append((event_id.decode(), json.loads(fields[b"event"])))
+        return events
+
+    def ack(self, group, *event_ids):
+        if event_ids:
+            self.client.xack(self.stream, group, *event_ids)
+
+
+class LocalEventBroker:
+    """In-process broker with the same interface as RedisEventBroker, for tests and local runs."""
+
+    def __init__(self, maxlen=INCIDENT_STREAM_MAXLEN):
+        self.events = deque(maxlen=maxlen)
+        self.groups = {}
+        self.pending = {}
+        self._next_id = 0
+        self._condition = threading.Condition()
+
+    def publish(self, event):
+        with self._condition:
+            self._next_id += 1
+            event_id = f"{int(time.time() * 1000)}-{self._next_id}"
+            self.events.append((self._next_id, event_id, event))
+            self._condition.notify_all()
+        return event_id
+
+    def create_group(self, group, start_id="$"):
+        with self._condition:
+            if group not in self.groups:
+                self.groups[group] = self._next_id if start_id == "$" else 0
+                self.pending[group] = {}
+
+    def read_group(self, group, consumer, count=100, block_ms=5000):
+        deadline = time.monotonic() + block_ms / 1000
+        with self._condition:
+            while True:
+                delivered = self.groups[group]
+                events = [(seq, event_id, event) for seq, event_id, event in self.events if seq > delivered][:count]
+                if events or time.monotonic() >= deadline:
+                    break
+                self._condition.wait(deadline - time.monotonic())
+
+            if events:
+                self.groups[group] = events[-1][0]
+            for _, event_id, event in events:
+                self.pending[group][event_id] = consumer
+            return [(event_id, event) for _, event_id, event in events]
+
+    def ack(self, group, *event_ids):
+        with self._condition:
+            for event_id in event_ids:
+                self.pending[group].pop(event_id, None)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None and INCIDENT_EVENTS_BROKER != "none":
+        _broker = LocalEventBroker() if INCIDENT_EVENTS_BROKER == "local" else RedisEventBroker()
+    return _broker
+
+
+def set_broker(broker):
+    """Replace the broker of this process, e.g. with a LocalEventBroker in tests."""
+    global _broker
+    _broker = broker
+
+
+def publish_incident(incident, recording):
+    """Publish a committed incident. A broker outage must never stop a detection stream."""
+    broker = get_broker()
+    if broker is None:
+        return None
+
+    try:
+        return broker.publish(incident_event(incident, recording))
+    except Exception as e:
+        print(f"Error publishing incident event: {e}")
+        return None
@@ -0,0 +1,226 @@
+#exporttask.py
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from app.celery import celery_app
+from app.database import SessionLocal
+from app.models import Incident, Recording, Zone
+
+# Root of the partitioned dataset, plant_id=<id>/day=<YYYY-MM-DD>/part-*.parquet
+EXPORT_DIR = os.getenv("INCIDENT_EXPORT_DIR", "./exports/incidents")
+# Incidents read and written per chunk, bounds the memory of an export whatever the time range
+EXPORT_CHUNK_SIZE = int(os.getenv("INCIDENT_EXPORT_CHUNK_SIZE", 50000))
+# Highest exported incident id, files starting with "_" are not part of the dataset
+WATERMARK_FILE = "_watermark.json"
+# An export only goes up to the highest id seen this many seconds before it starts reading. Ids
+# are assigned on insert, so a lower id can still be uncommitted when a higher one is visible.
+EXPORT_SAFETY_SECONDS = float(os.getenv("INCIDENT_EXPORT_SAFETY_SECONDS", 60))
+
+# Everything about an incident but its frame
+EXPORT_COLUMNS = [
+    Incident.id, Incident.timestamp, Incident.class_name, Incident.confidence, Incident.bbox,
+    Incident.framehash, Incident.frameref_id, Incident.occurrences, Incident.recording_id,
+    Recording.camera_id, Recording.detection_type_id, Zone.id.label("zone_id"), Zone.plant_id,
+]
+
+
+def export_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("class_name", pa.string()),
+        ("confidence", pa.float64()),
+        ("bbox", pa.string()),
+        ("framehash", pa.string()),
+        ("frameref_id", pa.int64()),
+        ("occurrences", pa.int64()),
+        ("recording_id", pa.int64()),
+        ("camera_id", pa.int64()),
+        ("detection_type_id", pa.int64()),
+        ("zone_id", pa.int64()),
+        ("plant_id", pa.int64()),
+        ("day", pa.string()),
+    ])
+
+
+def partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([("plant_id", pa.int64()), ("day", pa.string())]), flavor="hive")
+
+
+def day_strings(timestamps):
+    import pandas as pd
+    return pd.to_datetime(timestamps).dt.strftime("%Y-%m-%d")
+
+
+def read_watermark(root):
+    try:
+        with open(os.path.join(root, WATERMARK_FILE)) as f:
+            return json.load(f)["last_id"]
+    except FileNotFoundError:
+        return 0
+
+
+def write_watermark(root, last_id):
+    # Replaced in one rename, an interrupted export never leaves a half-written mark
+    path = os.path.join(root, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"last_id": last_id, "updated": datetime.utcnow().isoformat()}, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_chunk(db, after_id, up_to_id, chunk_size):
+    """DataFrame of the next chunk_size incidents after after_id up to up_to_id, in id order, without their frames."""
+    import pandas as pd
+
+    query = db.query(*EXPORT_COLUMNS).select_from(Incident) \
+        .outerjoin(Recording, Incident.recording_id == Recording.id) \
+        .outerjoin(Zone, Recording.zone_id == Zone.id) \
+        .filter(Incident.id > after_id, Incident.id <= up_to_id).order_by(Incident.id).limit(chunk_size)
+    return pd.DataFrame.from_records(query.all(), columns=list(export_schema().names[:-1]))
+
+
+def write_chunk(df, root):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df["day"] = day_strings(df["timestamp"])
+    table = pa.Table.from_pandas(df, schema=export_schema(), preserve_index=False)
+    # Named after the chunk's first id, so a chunk written again after a crash replaces its files
+    pq.write_to_dataset(table, root, partitioning=partitioning(),
+                        basename_template=f"part-{int(df['id'].iloc[0]):012d}-{{i}}.parquet",
+                        existing_data_behavior="overwrite_or_ignore")
+
+
+def export_incidents(db, root=EXPORT_DIR, chunk_size=EXPORT_CHUNK_SIZE, safety_seconds=EXPORT_SAFETY_SECONDS):
+    """
+    Append the incidents added since the last export to the Parquet dataset at root, chunk by
+    chunk. The watermark moves after each written chunk, so an interrupted export resumes where it
+    stopped. Incident ids only grow, late rows such as video analysis results with old timestamps
+    are picked up as well. Only ids up to the highest one committed safety_seconds before the
+    first read are exported: an insert still in flight then has the time to commit, instead of
+    being skipped for good once the watermark has passed its id.
+    """
+    os.makedirs(root, exist_ok=True)
+    last_id = read_watermark(root)
+    stats = {"from_id": last_id, "rows": 0, "chunks": 0}
+    started = time.monotonic()
+
+    up_to_id = db.query(func.max(Incident.id)).scalar() or 0
+    # End the snapshot, the chunks must see the rows that commit in the meantime
+    db.rollback()
+    if up_to_id > last_id and safety_seconds > 0:
+        time.sleep(safety_seconds)
+
+    while True:
+        df = read_chunk(db, last_id, up_to_id, chunk_size)
+        # Release the read snapshot between chunks, like the retention batches
+        db.rollback()
+        if df.empty:
+            break
+
+        write_chunk(df, root)
+        last_id = int(df["id"].iloc[-1])
+        write_watermark(root, last_id)
+        stats["rows"] += len(df)
+        stats["chunks"] += 1
+        print(f"Export: {stats['rows']} incident(s) written, up to id {last_id}.")
+
+    stats["to_id"] = last_id
+    stats["seconds"] = round(time.monotonic() - started, 2)
+    return stats
+
+
+def load_incidents(root=EXPORT_DIR, plant_id=None, start_date=None, columns=None, filters=None):
+    """
+    DataFrame of the exported incidents. plant_id and start_date prune whole partitions before
+    anything is read, filters are extra pyarrow expressions pushed down to the row groups.
+    """
+    import pyarrow.dataset as ds
+
+    # Before the first export: an empty table, with the schema given an empty directory reads as one too
+    if not os.path.isdir(root):
+        table = export_schema().empty_table()
+        return (table.select(columns) if columns else table).to_pandas()
+    dataset = ds.dataset(root, schema=export_schema(), format="parquet", partitioning=partitioning())
+    expression = None
+    conditions = list(filters or [])
+    if plant_id is not None:
+        conditions.append(ds.field("plant_id") == plant_id)
+    if start_date is not None:
+        conditions.append(ds.field("day") >= start_date.strftime("%Y-%m-%d"))
+        conditions.append(ds.field("timestamp") >= start_date)
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def get_report_data(root, plant_id: int, zone_id: int, days: int, detection_type_id: int, now=None):
+    """crud.get_report_data computed from the Parquet export with vectorized pandas operations."""
+    import pyarrow.dataset as ds
+
+    start_date = (now or datetime.now()) - timedelta(days=days)
+    filters = []
+    if zone_id:
+        filters.append(ds.field("zone_id") == zone_id)
+    elif plant_id is None:
+        # Same as the inner join of crud.get_report_data: zones without a plant, not recordings without a zone
+        filters.append(ds.field("plant_id").is_null() & ds.field("zone_id").is_valid())
+    if detection_type_id:
+        filters.append(ds.field("detection_type_id") == detection_type_id)
+    df = load_incidents(root, None if zone_id else plant_id, start_date, ["timestamp", "class_name"], filters)
+
+    # Incidents listing several missing classes count once per class
+    classes = df.assign(class_name=df["class_name"].str.split(",")).explode("class_name")
+    classes["class_name"] = classes["class_name"].str.strip()
+    classes["date"] = day_strings(classes["timestamp"])
+
+    by_type = classes["class_name"].value_counts(sort=False)
+    timeline = classes.groupby(["date", "class_name"]).size()
+    incidents_timeline = {}
+    for (date, class_name), count in timeline.items():
+        incidents_timeline.setdefault(date, {})[class_name] = int(count)
+
+    return {
+        "incidents_by_type": [{"type": class_name, "count": int(count)} for class_name, count in by_type.items()],
+        "incidents_timeline": incidents_timeline,
+    }
+
+
+@celery_app.task
+def run_incident_export(root=EXPORT_DIR, chunk_size=EXPORT_CHUNK_SIZE):
+    db = SessionLocal()
+    try:
+        return export_incidents(db, root, chunk_size)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export incidents to partitioned Parquet, or report from the export.")
+    parser.add_argument("--root", default=EXPORT_DIR)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--report", action="store_true", help="print the report data of the export instead of exporting")
+    parser.add_argument("--plant", type=int)
+    parser.add_argument("--zone", type=int)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--detection-type", type=int)
+    args = parser.parse_args()
+
+    if args.report:
+        print(json.dumps(get_report_data(args.root, args.plant, args.zone, args.days, args.detection_type), indent=2))
+    else:
+        db = SessionLocal()
+        try:
+            print(export_incidents(db, args.root, args.chunk_size))
+        finally:
+            db.close()
@@ -0,0 +1,224 @@
+#framebus.py
+import argparse
+import multiprocessing
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+import cv2
+import numpy as np
+
+# Header fields, stored as int64 at the start of the segment
+WRITE_SEQ, SLOTS, HEIGHT, WIDTH, CHANNELS = range(5)
+HEADER_FIELDS = 8
+
+FRAMEBUS_SLOTS = int(os.getenv("FRAMEBUS_SLOTS", 8))
+# How long a reader waits for a new frame before reporting the publisher as gone
+FRAMEBUS_READ_TIMEOUT = float(os.getenv("FRAMEBUS_READ_TIMEOUT", 10))
+FRAMEBUS_POLL_INTERVAL = 0.002
+
+
+def ring_name(camera_id):
+    return f"aptframes-cam{camera_id}"
+
+
+class FrameRing:
+    """
+    Ring of fixed-size frames in a multiprocessing.shared_memory segment, one writer and any
+    number of readers. Each slot carries the sequence number of the frame it holds, -1 while it
+    is being written, so a reader can tell a torn or overwritten slot from a valid one without locks.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        slots, height, width, channels = (int(v) for v in self.header[SLOTS:CHANNELS + 1])
+        self.shape = (height, width, channels)
+        self.slot_seqs = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=self.header.nbytes)
+        self.frames = np.ndarray((slots, height, width, channels), dtype=np.uint8, buffer=shm.buf,
+                                 offset=self.header.nbytes + self.slot_seqs.nbytes)
+
+    @classmethod
+    def create(cls, name, shape, slots=FRAMEBUS_SLOTS):
+        height, width, channels = shape
+        size = (HEADER_FIELDS + slots) * 8 + slots * height * width * channels
+        try:
+            # Left over by a publisher that died without cleaning up
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[SLOTS:CHANNELS + 1] = (slots, height, width, channels)
+        ring = cls(shm, owner=True)
+        ring.slot_seqs[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        shm = shared_memory.SharedMemory(name=name)
+        # Before Python 3.13 the resource tracker unlinks every segment a process touched when it
+        # exits, which would remove the ring from under the publisher
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def write_seq(self):
+        return int(self.header[WRITE_SEQ])
+
+    def publish(self, frame):
+        seq = self.write_seq + 1
+        slot = seq % len(self.slot_seqs)
+        self.slot_seqs[slot] = -1
+        if frame.shape == self.shape:
+            self.frames[slot] = frame
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=self.frames[slot])
+        self.slot_seqs[slot] = seq
+        self.header[WRITE_SEQ] = seq
+        return seq
+
+    def view(self, seq):
+        """Zero-copy view of frame seq. It stays valid until the ring wraps, check is_current(seq) after use."""
+        return self.frames[seq % len(self.slot_seqs)]
+
+    def is_current(self, seq):
+        return int(self.slot_seqs[seq % len(self.slot_seqs)]) == seq
+
+    def wait_for_frame(self, after_seq, timeout=FRAMEBUS_READ_TIMEOUT):
+        """Sequence number of the newest frame published after after_seq, None on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.write_seq
+            if seq > after_seq and self.is_current(seq):
+                return seq
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(FRAMEBUS_POLL_INTERVAL)
+
+    def close(self):
+        # Views must be dropped before the segment can be closed
+        del self.header, self.slot_seqs, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class FrameBusStream:
+    """
+    Reads a camera from the frame bus with the ResilientStream interface used by the stream tasks.
+    Only the newest frame is returned, so a slow reader skips frames instead of lagging behind.
+    The tasks draw on the frames they get, so read() copies the slot into a private buffer that is
+    reused for every frame; use the ring views directly for read-only consumers.
+    """
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.name = ring_name(camera_id)
+        self.ring = None
+        self.last_seq = 0
+        self.frame = None
+        self.stats = {"frames": 0, "skipped": 0, "reconnects": 0}
+
+    def connect(self):
+        while self.ring is None:
+            try:
+                self.ring = FrameRing.attach(self.name)
+            except FileNotFoundError:
+                print(f"Frame bus {self.name} not published yet, waiting.")
+                time.sleep(1)
+
+        self.frame = np.empty(self.ring.shape, dtype=np.uint8)
+        self.last_seq = self.ring.write_seq
+        print(f"Attached to frame bus {self.name} with frames of {self.ring.shape}.")
+
+    def read(self):
+        if self.ring is None:
+            self.connect()
+
+        while True:
+            seq = self.ring.wait_for_frame(self.last_seq)
+            if seq is None:
+                print(f"No frame on {self.name} for {FRAMEBUS_READ_TIMEOUT}s, re-attaching.")
+                self.stats["reconnects"] += 1
+                self.release()
+                self.connect()
+                continue
+
+            np.copyto(self.frame, self.ring.view(seq))
+            if not self.ring.is_current(seq):
+                # Overwritten while copying, take the next one
+                continue
+
+            self.stats["skipped"] += max(0, seq - self.last_seq - 1)
+            self.stats["frames"] += 1
+            self.last_seq = seq
+            return self.frame
+
+    def lag_seconds(self):
+        # The reader always takes the newest frame, how far it falls behind shows in stats["skipped"]
+        return None
+
+    def frame_position(self):
+        return None
+
+    def seek(self, frame_position):
+        pass
+
+    def grab(self):
+        if self.ring is None:
+            self.connect()
+        seq = self.ring.wait_for_frame(self.last_seq)
+        if seq is not None:
+            self.last_seq = seq
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def run_publisher(camera_id, slots=FRAMEBUS_SLOTS):
+    """Capture one camera and publish its frames on the frame bus until killed."""
+    from app import crud
+    from app.commontasks import open_stream
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        camera = crud.get_camera_by_id(db, camera_id)
+        source, backend = camera.ipaddress, camera.capturebackend
+    finally:
+        db.close()
+
+    # The publisher itself always decodes, whatever the consumers are configured with
+    stream = open_stream(source, backend=None if backend == "framebus" else backend, camera_id=camera_id)
+    frame = stream.read()
+    ring = FrameRing.create(ring_name(camera_id), frame.shape, slots)
+    print(f"Publishing camera {camera_id} on frame bus {ring_name(camera_id)} ({slots} slots of {frame.shape}).")
+
+    try:
+        while True:
+            ring.publish(frame)
+            frame = stream.read()
+    finally:
+        stream.release()
+        ring.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish camera frames on the shared-memory frame bus.")
+    parser.add_argument("camera_ids", nargs="+", type=int)
+    parser.add_argument("--slots", type=int, default=FRAMEBUS_SLOTS)
+    args = parser.parse_args()
+
+    publishers = [multiprocessing.Process(target=run_publisher, args=(camera_id, args.slots), name=f"capture-{camera_id}")
+                  for camera_id in args.camera_ids]
+    for publisher in publishers:
+        publisher.start()
+    for publisher in publishers:
+        publisher.join()
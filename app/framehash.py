@@ -0,0 +1,47 @@
+#framehash.py
+import cv2
+import numpy as np
+
+HASH_SIZE = 8
+# Margin around the annotated region, so the drawn box and its label are part of the hash
+REGION_MARGIN = 0.1
+
+
+def crop_region(frame, region, margin=REGION_MARGIN):
+    """Part of frame inside the x1, y1, x2, y2 region grown by margin, the whole frame without a region."""
+    if region is None:
+        return frame
+
+    height, width = frame.shape[:2]
+    x1, y1, x2, y2 = region
+    grow_x, grow_y = (x2 - x1) * margin, (y2 - y1) * margin
+    x1, y1 = max(0, int(x1 - grow_x)), max(0, int(y1 - grow_y))
+    x2, y2 = min(width, int(x2 + grow_x)), min(height, int(y2 + grow_y))
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        return frame
+    return frame[y1:y2, x1:x2]
+
+
+def dhash(frame, region=None, hash_size=HASH_SIZE):
+    """
+    Difference hash of a BGR frame: the crop is shrunk to (hash_size + 1) x hash_size grey pixels
+    and each bit says whether a pixel is brighter than its left neighbour. Robust to JPEG noise,
+    lighting drift and small label changes, sensitive to anything moving in the region.
+    """
+    crop = crop_region(frame, region)
+    grey = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(grey, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def format_hash(value, hash_size=HASH_SIZE):
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def parse_hash(value):
+    return int(value, 16)
@@ -0,0 +1,129 @@
+#inferenceprofile.py
+import argparse
+import time
+from collections import namedtuple
+
+# Inference settings of a detection type, None leaves the ultralytics default
+InferenceProfile = namedtuple("InferenceProfile", ["classes", "imgsz", "iou", "conf", "max_det"])
+DEFAULT_PROFILE = InferenceProfile(None, None, None, None, None)
+# The ultralytics predict defaults, applied when the profile leaves a setting empty
+DEFAULT_IOU = 0.7
+DEFAULT_CONF = 0.25
+DEFAULT_MAX_DET = 300
+
+
+def parse_classes(value):
+    if not value:
+        return None
+    return tuple(name.strip() for name in value.split(",") if name.strip()) or None
+
+
+def profile_from_detection_type(detection_type, default_classes=None):
+    if detection_type is None:
+        return DEFAULT_PROFILE._replace(classes=default_classes)
+    return InferenceProfile(
+        classes=parse_classes(detection_type.classes) or default_classes,
+        imgsz=detection_type.imgsz,
+        iou=detection_type.iou,
+        conf=detection_type.minconfidence,
+        max_det=detection_type.maxdet,
+    )
+
+
+def get_inference_profile(db, record_id, default_classes=None):
+    """Profile of the detection type of a recording."""
+    from app.models import DetectionType, Recording
+
+    detection_type = db.query(DetectionType).join(Recording, Recording.detection_type_id == DetectionType.id) \
+        .filter(Recording.id == record_id).first()
+    return profile_from_detection_type(detection_type, default_classes)
+
+
+def class_ids(model, class_names):
+    """Model class ids of class_names, names the model does not know are reported and left out."""
+    ids = {name: cls for cls, name in model.names.items()}
+    unknown = [name for name in class_names if name not in ids]
+    if unknown:
+        print(f"Classes {unknown} are not known to the model, ignoring them.")
+    return sorted(ids[name] for name in class_names if name in ids)
+
+
+def input_size(model, profile):
+    from app.preprocess import model_input_size
+    return profile.imgsz or model_input_size(model)
+
+
+def inference_options(model, profile):
+    """
+    Keyword arguments for the model call. The whitelist makes NMS and post-processing skip every
+    other class. Every setting is always passed: ultralytics keeps call arguments on the model's
+    predictor, so on a cached model a value left out would be the previous caller's.
+    """
+    # A whitelist the model knows nothing of would filter everything, run unfiltered instead
+    classes = class_ids(model, profile.classes) if profile.classes else None
+    return {
+        "verbose": False,
+        "classes": classes or None,
+        "iou": profile.iou if profile.iou is not None else DEFAULT_IOU,
+        "conf": profile.conf if profile.conf is not None else DEFAULT_CONF,
+        "max_det": profile.max_det if profile.max_det is not None else DEFAULT_MAX_DET,
+    }
+
+
+def benchmark_profile(model_path, video_path, profile, frames):
+    """Mean preprocess/inference/postprocess milliseconds and detections per frame, default settings vs profile."""
+    import cv2
+    from app.modelcache import get_model
+    from app.preprocess import LetterboxPreprocessor
+
+    model = get_model(model_path)
+    cap = cv2.VideoCapture(video_path)
+    sample = []
+    while len(sample) < frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        sample.append(frame)
+    cap.release()
+
+    report = {}
+    for label, current in (("default", DEFAULT_PROFILE), ("profile", profile)):
+        preprocessor = LetterboxPreprocessor(input_size(model, current))
+        options = inference_options(model, current)
+        # Warm-up, the first call includes lazy initialisation
+        model(preprocessor.tensor_batch(1), **options)
+
+        totals = {"preprocess": 0.0, "inference": 0.0, "postprocess": 0.0}
+        detections = 0
+        for frame in sample:
+            started = time.perf_counter()
+            preprocessor(frame)
+            tensor = preprocessor.tensor_batch(1)
+            totals["preprocess"] += (time.perf_counter() - started) * 1000
+            result = model(tensor, **options)[0]
+            totals["inference"] += result.speed["inference"]
+            totals["postprocess"] += result.speed["postprocess"]
+            detections += len(result.boxes)
+
+        report[label] = {name: value / len(sample) for name, value in totals.items()}
+        report[label]["detections"] = detections / len(sample)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-frame inference cost with and without an inference profile.")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--video", default="./yolomodels/testvideo.mp4")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--classes", help="comma-separated class whitelist")
+    parser.add_argument("--imgsz", type=int)
+    parser.add_argument("--iou", type=float)
+    parser.add_argument("--conf", type=float)
+    parser.add_argument("--max-det", type=int)
+    args = parser.parse_args()
+
+    profile = InferenceProfile(parse_classes(args.classes), args.imgsz, args.iou, args.conf, args.max_det)
+    report = benchmark_profile(args.model, args.video, profile, args.frames)
+    print(f"{'':>8} {'pre ms':>8} {'infer ms':>9} {'post ms':>8} {'dets':>6}")
+    for label, row in report.items():
+        print(f"{label:>8} {row['preprocess']:>8.2f} {row['inference']:>9.2f} {row['postprocess']:>8.2f} {row['detections']:>6.1f}")
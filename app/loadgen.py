@@ -0,0 +1,224 @@
+#loadgen.py
+import argparse
+import datetime
+import random
+import signal
+import statistics
+import subprocess
+import time
+
+from app import crud
+from app.client import resolve_task_name, start_detection, stop_detection
+from app.database import Base, SQLALCHEMY_DATABASE_URL, SessionLocal, engine
+from app.models import Camera, DetectionType, Plant, Recording, Zone
+from app.streamstats import read_stream_stats
+
+LOADGEN_PREFIX = "loadgen"
+# Kernel receive buffer asked for on each UDP input, a slow reader drops packets instead of erroring out
+UDP_FIFO_SIZE = 50000000
+
+
+class CameraPublisher:
+    """
+    One simulated camera: an ffmpeg process looping the test video in real time, remuxed without
+    re-encoding so a node can serve dozens of them. The read rate is jittered per camera so the
+    streams do not run in lockstep.
+    """
+
+    def __init__(self, index, video_path, transport, base_port, rtsp_url, jitter):
+        self.index = index
+        self.video_path = video_path
+        self.transport = transport
+        self.readrate = 1 + random.uniform(-jitter, jitter)
+        if transport == "udp":
+            port = base_port + index
+            self.publish_url = f"udp://127.0.0.1:{port}?pkt_size=1316"
+            self.source_url = f"udp://127.0.0.1:{port}?overrun_nonfatal=1&fifo_size={UDP_FIFO_SIZE}"
+        else:
+            self.publish_url = self.source_url = f"{rtsp_url.rstrip('/')}/cam{index}"
+        self.process = None
+        self.disconnects = 0
+
+    def command(self):
+        output = ["-f", "mpegts"] if self.transport == "udp" else ["-f", "rtsp", "-rtsp_transport", "tcp"]
+        return ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+                "-readrate", f"{self.readrate:.3f}", "-stream_loop", "-1", "-i", self.video_path,
+                "-an", "-c", "copy", *output, self.publish_url]
+
+    def start(self):
+        self.process = subprocess.Popen(self.command(), stdin=subprocess.DEVNULL)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGKILL)
+            self.process.wait()
+        self.process = None
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+
+class DisconnectInjector:
+    """Kills a random publisher at exponentially distributed intervals and restarts it after an outage."""
+
+    def __init__(self, publishers, mean_interval, outage_seconds):
+        self.publishers = publishers
+        self.mean_interval = mean_interval
+        self.outage_seconds = outage_seconds
+        self.down = {}
+        self.next_disconnect = self._schedule()
+
+    def _schedule(self):
+        return time.monotonic() + random.expovariate(1 / self.mean_interval) if self.mean_interval else float("inf")
+
+    def tick(self, active_count):
+        now = time.monotonic()
+        for index, until in list(self.down.items()):
+            if now >= until:
+                self.publishers[index].start()
+                del self.down[index]
+
+        if now >= self.next_disconnect:
+            candidates = [index for index in range(active_count) if index not in self.down]
+            if candidates:
+                index = random.choice(candidates)
+                print(f"Injecting a {self.outage_seconds}s disconnect on camera {index}.")
+                self.publishers[index].stop()
+                self.publishers[index].disconnects += 1
+                self.down[index] = now + self.outage_seconds
+            self.next_disconnect = self._schedule()
+
+        # Publishers that died on their own come back right away
+        for index in range(active_count):
+            if index not in self.down and not self.publishers[index].running:
+                self.publishers[index].start()
+
+
+def seed(db, publishers, task_name, model_path, backend, confidence):
+    """One plant and zone, then a camera and an open recording per simulated camera. Returns (camera_id, record_id) pairs."""
+    plant = Plant(name=f"{LOADGEN_PREFIX} plant", description="Synthetic camera fleet", plantConfidence=confidence / 100)
+    db.add(plant)
+    db.flush()
+    zone = Zone(title=f"{LOADGEN_PREFIX} zone", plant_id=plant.id, zoneconfidence=confidence / 100)
+    db.add(zone)
+
+    detection_type = db.query(DetectionType).filter(DetectionType.task_name == task_name,
+                                                    DetectionType.modelpath == model_path).first()
+    if detection_type is None:
+        detection_type = DetectionType(name=f"{LOADGEN_PREFIX} {task_name}", modelpath=model_path, task_name=task_name)
+        db.add(detection_type)
+    db.flush()
+
+    streams = []
+    for publisher in publishers:
+        camera = Camera(name=f"{LOADGEN_PREFIX}-cam{publisher.index}", ipaddress=publisher.source_url,
+                        capturebackend=backend, zone_id=zone.id)
+        db.add(camera)
+        db.flush()
+        recording = Recording(name=f"{LOADGEN_PREFIX}-cam{publisher.index}", starttime=datetime.datetime.now(),
+                              status=True, zone_id=zone.id, camera_id=camera.id,
+                              detection_type_id=detection_type.id, confidence=confidence)
+        db.add(recording)
+        db.flush()
+        streams.append((camera.id, recording.id))
+    db.commit()
+    return streams
+
+
+def node_usage():
+    import psutil
+    memory = psutil.virtual_memory()
+    return psutil.cpu_percent(interval=1), memory.used / 2**30, memory.percent
+
+
+def summarise(values):
+    if not values:
+        return "n/a"
+    return f"min {min(values):.2f} / median {statistics.median(values):.2f} / max {max(values):.2f}"
+
+
+def report(count, record_ids, publishers):
+    stats = read_stream_stats(record_ids)
+    cpu, memory_gb, memory_percent = node_usage()
+    processed = [s["processed_fps"] for s in stats.values()]
+    captured = [s["capture_fps"] for s in stats.values()]
+    lag = [s["lag_seconds"] for s in stats.values() if s["lag_seconds"] is not None]
+    reconnects = sum(s["reconnects"] for s in stats.values())
+    disconnects = sum(publisher.disconnects for publisher in publishers[:count])
+
+    print(f"--- {count} streams, {len(stats)} reporting ---")
+    print(f"processed fps: {summarise(processed)}")
+    print(f"capture fps:   {summarise(captured)}")
+    print(f"lag seconds:   {summarise(lag)}")
+    print(f"reconnects:    {reconnects} for {disconnects} injected disconnects")
+    print(f"node:          cpu {cpu:.0f}%, memory {memory_gb:.1f} GB ({memory_percent:.0f}%)")
+    for record_id in record_ids:
+        if record_id not in stats:
+            print(f"recording {record_id}: no stats (not started or stalled)")
+
+
+def run(args):
+    counts = sorted(int(count) for count in args.counts.split(","))
+    publishers = [CameraPublisher(index, args.video, args.transport, args.base_port, args.rtsp_url, args.jitter)
+                  for index in range(counts[-1])]
+    injector = DisconnectInjector(publishers, args.disconnect_interval, args.outage_seconds)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    streams = seed(db, publishers, args.task, args.model, args.backend, args.confidence)
+    task_name = resolve_task_name(args.task)
+    tasks = []
+
+    try:
+        for count in counts:
+            for index in range(len(tasks), count):
+                publishers[index].start()
+                camera_id, record_id = streams[index]
+                result = start_detection(task_name, camera_id, args.model, record_id)
+                crud.update_recording_task_id(db, record_id, result.id)
+                tasks.append(result.id)
+            print(f"Running {count} streams for {args.step_seconds}s.")
+
+            step_end = time.monotonic() + args.step_seconds
+            next_report = time.monotonic() + args.report_interval
+            while time.monotonic() < step_end:
+                injector.tick(count)
+                if time.monotonic() >= next_report:
+                    report(count, [record_id for _, record_id in streams[:count]], publishers)
+                    next_report += args.report_interval
+                time.sleep(1)
+            report(count, [record_id for _, record_id in streams[:count]], publishers)
+    finally:
+        for task_id in tasks:
+            stop_detection(task_id)
+        for publisher in publishers:
+            publisher.stop()
+        for _, record_id in streams:
+            crud.update_recording(db, record_id)
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a camera fleet from the test video and ramp up detection streams.")
+    parser.add_argument("--counts", default="10,30,50", help="stream counts to step through")
+    parser.add_argument("--step-seconds", type=float, default=300)
+    parser.add_argument("--report-interval", type=float, default=60)
+    parser.add_argument("--task", default="run_ppe_detection")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--confidence", type=int, default=50)
+    parser.add_argument("--backend", default="opencv", choices=["opencv", "ffmpeg"])
+    parser.add_argument("--video", default="./yolomodels/testvideo.mp4")
+    parser.add_argument("--transport", default="udp", choices=["udp", "rtsp"],
+                        help="udp needs nothing else, rtsp publishes to an RTSP server such as mediamtx at --rtsp-url")
+    parser.add_argument("--base-port", type=int, default=20000)
+    parser.add_argument("--rtsp-url", default="rtsp://127.0.0.1:8554")
+    parser.add_argument("--jitter", type=float, default=0.05, help="spread of the per-camera read rate around real time")
+    parser.add_argument("--disconnect-interval", type=float, default=120,
+                        help="mean seconds between injected disconnects across the fleet, 0 disables them")
+    parser.add_argument("--outage-seconds", type=float, default=15)
+    args = parser.parse_args()
+
+    if ":memory:" in SQLALCHEMY_DATABASE_URL:
+        parser.error("DB_CONNECTION_STRING must point at a database the workers share, e.g. sqlite:////data/loadgen.db")
+    run(args)
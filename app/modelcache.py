@@ -0,0 +1,76 @@
+#modelcache.py
+import argparse
+import gc
+
+# Models loaded in this process, keyed by path. Filled in the Celery parent when PRELOAD_MODELS is
+# set, so forked children share the weights copy-on-write instead of loading their own copy.
+_models = {}
+_parent_torch_threads = None
+
+
+def get_model(model_path):
+    model = _models.get(model_path)
+    if model is None:
+        from ultralytics import YOLO
+        model = _models[model_path] = YOLO(model_path)
+    return model
+
+
+def preload_models(model_paths):
+    """
+    Load and fuse every model in the parent process before the pool forks. Nothing here may start
+    a torch or OpenMP thread pool: the threads would not exist in the children while the pool
+    still believes they do, which deadlocks the first inference. Hence one intra-op thread and no
+    warm-up inference in the parent.
+    """
+    global _parent_torch_threads
+    import torch
+    import ultralytics  # noqa: F401
+
+    _parent_torch_threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+
+    for model_path in sorted(set(model_paths)):
+        try:
+            model = get_model(model_path)
+            # Fusing rewrites the weights, do it once here rather than in every child
+            model.fuse()
+            print(f"Preloaded model {model_path}.")
+        except Exception as e:
+            print(f"Could not preload model {model_path}: {e}")
+
+    # Move everything allocated so far out of the collector's reach, otherwise the first
+    # collection in each child touches every object header and copies the pages
+    gc.collect()
+    gc.freeze()
+
+
+def init_child_process():
+    """Undo the parent-only torch settings in a freshly forked child."""
+    if _parent_torch_threads is None:
+        return
+    import torch
+    torch.set_num_threads(_parent_torch_threads)
+
+
+def memory_report(parent_pid):
+    """RSS, PSS and USS in MB of a worker parent and its children."""
+    import psutil
+
+    parent = psutil.Process(parent_pid)
+    rows = []
+    for process in [parent] + parent.children():
+        info = process.memory_full_info()
+        rows.append((process.pid, info.rss / 2**20, info.pss / 2**20, info.uss / 2**20))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-process memory of a Celery worker and its pool children.")
+    parser.add_argument("parent_pid", type=int)
+    args = parser.parse_args()
+
+    print(f"{'pid':>8} {'rss MB':>10} {'pss MB':>10} {'uss MB':>10}")
+    for pid, rss, pss, uss in memory_report(args.parent_pid):
+        marker = " (parent)" if pid == args.parent_pid else ""
+        print(f"{pid:>8} {rss:>10.1f} {pss:>10.1f} {uss:>10.1f}{marker}")
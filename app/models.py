@@ -1,7 +1,7 @@
 import datetime
 import enum
-from sqlalchemy import Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, LargeBinary, String, TIMESTAMP
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, DateTime, Enum, Float, ForeignKey, Index, Integer, LargeBinary, String, Text, TIMESTAMP
+from sqlalchemy.orm import deferred, relationship
 
 from .database import Base
 
@@ -9,6 +9,11 @@ class PlantStatus(str, enum.Enum):
     active = "active"
     inactive = "inactive"
 
+class CaptureBackend(str, enum.Enum):
+    opencv = "opencv"
+    ffmpeg = "ffmpeg"
+    framebus = "framebus"
+
 class Plant(Base):
     __tablename__ = "plants"
 
@@ -63,6 +68,7 @@ class Camera(Base):
     name = Column(String(100), index=True)
     description = Column(String(100))
     ipaddress = Column(String(100))
+    capturebackend = Column(Enum(CaptureBackend), default=CaptureBackend.opencv)
     zone_id = Column(Integer, ForeignKey("zones.id"))
 
     zone = relationship("Zone", back_populates="cameras")
@@ -97,11 +103,25 @@ class Incident(Base):
     class_name = Column(String(256), index=True)
     confidence = Column(Float)
     bbox = Column(String(256))
-    frame = Column(LargeBinary(length=(2**32)-1))
+    # Only loaded when accessed, listing incidents must not pull the JPEG blobs
+    frame = deferred(Column(LargeBinary(length=(2**32)-1)))
+    # Set once the retention job has replaced the frame by a thumbnail
+    framecompacted = Column(Boolean, default=False)
+    # Perceptual hash of the annotated region, used to spot repeats of the same scene
+    framehash = Column(String(16))
+    # Set instead of frame when the scene matched an earlier incident, which holds the frame
+    frameref_id = Column(Integer, ForeignKey("incidents.id"))
+    # Incidents sharing this incident's frame, itself included
+    occurrences = Column(Integer, default=1)
     recording_id = Column(Integer, ForeignKey("recordings.id"))
 
     recording = relationship("Recording", back_populates="incidents")
 
+    __table_args__ = (
+        # Keyset pagination and the debounce lookup of the stream tasks
+        Index("ix_incidents_recording_timestamp_id", "recording_id", "timestamp", "id"),
+    )
+
 
 class Scenario(Base):
     __tablename__ = "scenarios"
@@ -118,6 +138,26 @@ class DetectionType(Base):
     description = Column(String(100))
     modelpath = Column(String(100))
     task_name = Column(String(100))
+    # Inference profile, empty columns keep the ultralytics defaults
+    classes = Column(String(256))  # comma-separated class names the task acts on
+    imgsz = Column(Integer)
+    iou = Column(Float)
+    minconfidence = Column(Float)
+    maxdet = Column(Integer)
+    # JSON list of rules (app.rules), empty uses the built-in rule set of task_name
+    rules = Column(Text)
 
     recordings = relationship("Recording", back_populates="detectiontype")
-    
+
+
+class RetentionPolicy(Base):
+    __tablename__ = "retentionpolicies"
+
+    id = Column(Integer, primary_key=True)
+    plant_id = Column(Integer, ForeignKey("plants.id"), unique=True)
+    # Days incidents keep their full resolution frame before it is replaced by a thumbnail
+    fullframedays = Column(Integer)
+    # Days after which incidents are deleted
+    retentiondays = Column(Integer)
+
+    plant = relationship("Plant")
@@ -0,0 +1,153 @@
+#notifications.py
+import argparse
+import os
+import smtplib
+import socketserver
+from collections import Counter
+from email.message import EmailMessage
+from email.utils import make_msgid
+from html import escape
+
+# smtp sends mail, console prints the digests (development)
+NOTIFY_TRANSPORT = os.getenv("NOTIFY_TRANSPORT", "smtp")
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 25))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "0").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+NOTIFY_SENDER = os.getenv("NOTIFY_SENDER", "incidents@localhost")
+# Thumbnails embedded in one digest, the most recent incidents first
+NOTIFY_MAX_THUMBNAILS = int(os.getenv("NOTIFY_MAX_THUMBNAILS", 6))
+
+
+class SmtpTransport:
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, message):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(message)
+
+
+class ConsoleTransport:
+    """Prints the text part of every digest instead of sending it."""
+
+    def send(self, message):
+        print(f"To: {message['To']}\nSubject: {message['Subject']}\n\n{message.get_body(('plain',)).get_content()}")
+
+
+_transport = None
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        _transport = ConsoleTransport() if NOTIFY_TRANSPORT == "console" else SmtpTransport()
+    return _transport
+
+
+def set_transport(transport):
+    """Replace the transport of this process, anything with a send(EmailMessage) method."""
+    global _transport
+    _transport = transport
+
+
+def render_digest(assignee, incidents, thumbnails, sender=NOTIFY_SENDER):
+    """
+    One mail for a batch of incidents: counts per class and recording, the list of incidents and
+    up to NOTIFY_MAX_THUMBNAILS inline thumbnails. incidents are (Incident, recording name) pairs,
+    thumbnails maps incident id to JPEG bytes.
+    """
+    incidents = sorted(incidents, key=lambda item: item[0].timestamp)
+    by_class = Counter(incident.class_name for incident, _ in incidents)
+    by_recording = Counter(recording_name for _, recording_name in incidents)
+    first, last = incidents[0][0].timestamp, incidents[-1][0].timestamp
+
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = assignee.email
+    message["Subject"] = f"{len(incidents)} incident(s) between {first:%Y-%m-%d %H:%M} and {last:%H:%M} UTC"
+
+    lines = [f"Hello {assignee.name},", "", f"{len(incidents)} incident(s) were raised in your zones:", ""]
+    lines += [f"  {count:>4}  {class_name}" for class_name, count in by_class.most_common()]
+    lines += ["", "Per recording:"]
+    lines += [f"  {count:>4}  {name}" for name, count in by_recording.most_common()]
+    lines += ["", "Incidents:"]
+    lines += [f"  #{incident.id}  {incident.timestamp:%Y-%m-%d %H:%M:%S}  {incident.class_name}  ({name})"
+              for incident, name in incidents]
+    message.set_content("\n".join(lines) + "\n")
+
+    cids = {incident_id: make_msgid(domain="incidents") for incident_id in thumbnails}
+    rows = "".join(f"<tr><td>{count}</td><td>{escape(class_name)}</td></tr>" for class_name, count in by_class.most_common())
+    images = "".join(
+        f'<figure><img src="cid:{cids[incident.id][1:-1]}" alt="incident {incident.id}">'
+        f"<figcaption>#{incident.id} {incident.timestamp:%H:%M:%S} {escape(incident.class_name)} ({escape(name)})</figcaption></figure>"
+        for incident, name in reversed(incidents) if incident.id in thumbnails
+    )
+    message.add_alternative(
+        f"<p>Hello {escape(assignee.name or '')},</p>"
+        f"<p>{len(incidents)} incident(s) between {first:%Y-%m-%d %H:%M} and {last:%H:%M} UTC.</p>"
+        f"<table><tr><th>Count</th><th>Type</th></tr>{rows}</table>{images}",
+        subtype="html",
+    )
+    html = message.get_payload()[1]
+    for incident_id, jpeg in thumbnails.items():
+        html.add_related(jpeg, maintype="image", subtype="jpeg", cid=cids[incident_id])
+    return message
+
+
+class DebugSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept a message and print it."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 debug smtp ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("DATA"):
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                data = []
+                for raw in iter(self.rfile.readline, b""):
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw.decode(errors="replace").replace("\r\n", "\n"))
+                print("".join(data).split("\n\n", 1)[0] if not self.server.verbose else "".join(data))
+                print("-" * 72)
+                self.reply("250 ok")
+            elif command.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            elif command.startswith(("EHLO", "HELO")):
+                self.reply("250 debug smtp")
+            else:
+                self.reply("250 ok")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP server printing the digests it receives.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--verbose", action="store_true", help="print whole messages, not only the headers")
+    args = parser.parse_args()
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((args.host, args.port), DebugSMTPHandler) as server:
+        server.verbose = args.verbose
+        print(f"Debugging SMTP server on {args.host}:{args.port}, point SMTP_HOST/SMTP_PORT at it.")
+        server.serve_forever()
@@ -0,0 +1,157 @@
+#notifytask.py
+import os
+import time
+
+from app import crud
+from app.celery import celery_app
+from app.database import SessionLocal
+from app.events import get_broker
+from app.models import Assignee, Incident, Recording, Zone
+from app.notifications import NOTIFY_MAX_THUMBNAILS, get_transport, render_digest
+from app.redisclient import get_redis
+from app.retentiontask import make_thumbnail
+
+# Consumer group of the incident stream the digests are built from
+NOTIFY_GROUP = os.getenv("NOTIFY_GROUP", "notifications")
+NOTIFY_CONSUMER = "digest-collector"
+# Minimum seconds between two digests to the same assignee, incidents in between are coalesced
+NOTIFY_MIN_INTERVAL = int(os.getenv("NOTIFY_MIN_INTERVAL", 15 * 60))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 5))
+# Lifetime of the marker of a queued or running digest, longer than a digest with all its retries
+NOTIFY_QUEUED_TTL = int(os.getenv("NOTIFY_QUEUED_TTL", 60 * 60))
+NOTIFY_READ_BATCH = 500
+
+
+def pending_key(assignee_id):
+    return f"notify:pending:{assignee_id}"
+
+
+def sending_key(assignee_id, task_id):
+    return f"notify:sending:{assignee_id}:{task_id}"
+
+
+def queued_key(assignee_id):
+    return f"notify:queued:{assignee_id}"
+
+
+def last_sent_key(assignee_id):
+    return f"notify:last:{assignee_id}"
+
+
+def assignees_of_recordings(db, recording_ids):
+    """recording id -> assignee id, the recording's own assignee first, then its zone's."""
+    rows = db.query(Recording.id, Recording.assignee_id, Zone.assignee_id) \
+        .outerjoin(Zone, Recording.zone_id == Zone.id).filter(Recording.id.in_(recording_ids))
+    return {recording_id: recording_assignee or zone_assignee for recording_id, recording_assignee, zone_assignee in rows}
+
+
+def collect_events(db, broker, client):
+    """Move the new incident events into the per-assignee pending sets, returns the number of events read."""
+    total = 0
+    while True:
+        events = broker.read_group(NOTIFY_GROUP, NOTIFY_CONSUMER, count=NOTIFY_READ_BATCH, block_ms=1)
+        if not events:
+            return total
+
+        assignees = assignees_of_recordings(db, {event["recording_id"] for _, event in events})
+        pipe = client.pipeline()
+        for _, event in events:
+            assignee_id = assignees.get(event["recording_id"])
+            if assignee_id is not None:
+                pipe.sadd(pending_key(assignee_id), event["incident_id"])
+        pipe.execute()
+        broker.ack(NOTIFY_GROUP, *[event_id for event_id, _ in events])
+        total += len(events)
+
+
+@celery_app.task
+def collect_incident_notifications():
+    """Coalesce new incidents per assignee and queue a digest for every assignee that may get one."""
+    broker = get_broker()
+    if broker is None:
+        return {"events": 0, "digests": 0}
+
+    client = get_redis()
+    broker.create_group(NOTIFY_GROUP)
+    db = SessionLocal()
+    try:
+        events = collect_events(db, broker, client)
+    finally:
+        db.close()
+
+    digests = 0
+    for key in client.scan_iter(pending_key("*")):
+        assignee_id = int(key.decode().rsplit(":", 1)[1])
+        # Rate limit: the pending set keeps growing until the assignee's interval has passed
+        if client.exists(last_sent_key(assignee_id)):
+            continue
+        # One digest in flight per assignee, however long the jobs queue holds it
+        if not client.set(queued_key(assignee_id), 1, nx=True, ex=NOTIFY_QUEUED_TTL):
+            continue
+        send_assignee_digest.delay(assignee_id)
+        digests += 1
+
+    print(f"Notifications: {events} event(s) collected, {digests} digest(s) queued.")
+    return {"events": events, "digests": digests}
+
+
+def load_digest(db, incident_ids):
+    """(Incident, recording name) pairs and thumbnails of the most recent ones."""
+    rows = db.query(Incident, Recording.name).outerjoin(Recording, Incident.recording_id == Recording.id) \
+        .filter(Incident.id.in_(incident_ids)).all()
+    incidents = [(incident, name or f"recording {incident.recording_id}") for incident, name in rows]
+
+    thumbnails = {}
+    for incident, _ in sorted(incidents, key=lambda item: item[0].timestamp, reverse=True)[:NOTIFY_MAX_THUMBNAILS]:
+        frame = crud.get_incident_frame(db, incident.id)
+        thumbnail = make_thumbnail(frame) if frame else None
+        if thumbnail is not None:
+            thumbnails[incident.id] = thumbnail
+    return incidents, thumbnails
+
+
+@celery_app.task(bind=True, max_retries=NOTIFY_MAX_RETRIES)
+def send_assignee_digest(self, assignee_id):
+    """Send one digest with everything pending for an assignee. On failure the incidents go back to pending."""
+    client = get_redis()
+    pending, sending, queued = pending_key(assignee_id), sending_key(assignee_id, self.request.id), queued_key(assignee_id)
+
+    # A retry of this task resumes its own batch, anything else claims the pending set into its own key
+    if not (self.request.retries and client.exists(sending)):
+        import redis
+        try:
+            claimed = client.renamenx(pending, sending)
+        except redis.ResponseError:
+            # Nothing pending any more
+            claimed = False
+        if not claimed:
+            client.delete(queued)
+            return {"assignee_id": assignee_id, "sent": 0}
+    incident_ids = [int(incident_id) for incident_id in client.smembers(sending)]
+
+    db = SessionLocal()
+    try:
+        assignee = db.query(Assignee).get(assignee_id)
+        if assignee is None or not assignee.email:
+            print(f"Assignee {assignee_id} has no email address, dropping {len(incident_ids)} notification(s).")
+            client.delete(sending, queued)
+            return {"assignee_id": assignee_id, "sent": 0}
+
+        incidents, thumbnails = load_digest(db, incident_ids)
+        if incidents:
+            get_transport().send(render_digest(assignee, incidents, thumbnails))
+    except Exception as e:
+        print(f"Error sending digest to assignee {assignee_id}: {e}")
+        if self.request.retries >= self.max_retries:
+            # Give the incidents back, the next collection run tries again
+            client.sunionstore(pending, [pending, sending])
+            client.delete(sending, queued)
+            raise
+        raise self.retry(exc=e, countdown=min(60 * 2 ** self.request.retries, NOTIFY_MIN_INTERVAL))
+    finally:
+        db.close()
+
+    client.set(last_sent_key(assignee_id), int(time.time()), ex=NOTIFY_MIN_INTERVAL)
+    client.delete(sending, queued)
+    print(f"Digest with {len(incidents)} incident(s) sent to assignee {assignee_id}.")
+    return {"assignee_id": assignee_id, "sent": len(incidents)}
@@ -1,182 +1,89 @@
 #ppetask.py
-import datetime
-import time
-import cv2
-from ultralytics import YOLO
-from app import crud
-from app.database import SessionLocal
-from app.models import Incident
-from .celery import celery_app
-from app.celery import celery_app
-from app.commontasks import initialize_camera, process_frame, should_skip_detection, detection_cache
-
-
-
-def is_within_person_box(ppe_box, person_box):
-    """Check if the PPE box is inside the person box."""
-    ppe_x1, ppe_y1, ppe_x2, ppe_y2 = ppe_box
-    person_x1, person_y1, person_x2, person_y2 = person_box
-
-    return (ppe_x1 >= person_x1 and ppe_y1 >= person_y1 and
-            ppe_x2 <= person_x2 and ppe_y2 <= person_y2)
-
-
-def handle_detections_with_multiple_persons(model, frame, zoneconf, zonescenarios):
-    results = model(frame)
-    detections = results[0].boxes
-    detected_classes = {}
-    person_boxes = []
-
-    # Step 1: Detect all persons and store their bounding boxes
-    for det in detections:
-        try:
-            box = det.xyxy[0].tolist()
-            conf = det.conf[0].item()
-            cls = int(det.cls[0].item())
-            class_name = model.names[cls]
-
-            if conf >= zoneconf:
-                detected_classes[class_name] = conf
-                
-                if class_name == 'person':
-                    person_boxes.append({
-                        'box': box,  
-                        'missing_ppe': set(zonescenarios), 
-                        'detected_ppe': [] 
-                    })
-                    pt1 = (int(box[0]), int(box[1]))
-                    pt2 = (int(box[2]), int(box[3]))
-                    cv2.rectangle(frame, pt1, pt2, (255, 0, 0), 2)
-                    label = f'Person {conf:.2f}'
-                    cv2.putText(frame, label, (int(box[0]), int(box[1]) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-
-        except Exception as e:
-            print(f"Error processing person detection: {e}")
+import os
+import numpy as np
+from app.celery import celery_app, STREAM_TASK_OPTIONS
+from app.commontasks import detect, detections_from_result, Detections
+from app.inferenceprofile import DEFAULT_PROFILE, inference_options
+from app.modelcache import get_model
+from app.preprocess import LetterboxPreprocessor, model_input_size
+from app.rules import PPE_RULES
+from app.streamtask import default_detector, run_rule_stream
+
+# Two-stage mode: a small person detector runs on the full frame, the PPE model only on person crops
+PPE_TWO_STAGE = os.getenv("PPE_TWO_STAGE", "0").lower() in ("1", "true", "yes")
+PERSON_MODEL_PATH = os.getenv("PPE_PERSON_MODEL", "./yolomodels/yolov8n.pt")
+# Class id of person in the COCO-trained person detector
+PERSON_CLASS_ID = 0
+# Input size of the PPE model on crops, a crop is usually much smaller than the frame so this
+# keeps helmets and vests close to their native resolution
+PPE_CROP_SIZE = int(os.getenv("PPE_CROP_SIZE", 320))
+# Fraction of the person box added on each side of the crop
+PPE_CROP_MARGIN = float(os.getenv("PPE_CROP_MARGIN", 0.1))
+PPE_MAX_CROPS = int(os.getenv("PPE_MAX_CROPS", 8))
+
+
+def detect_two_stage(person_model, model, frame, person_preprocessor, crop_preprocessor, person_conf, person_class_id,
+                     options=None, person_options=None):
+    """
+    Stage one finds people on the full frame, stage two runs the PPE model on a batch of padded
+    person crops. Returns one Detections table in frame coordinates and PPE model class ids, with
+    the people of stage one as the PPE model's person class (person_class_id), so the PPE
+    containment rule reads it like a single-stage table. Only the people whose crop went through
+    stage two are in the table, a person left out would otherwise miss every PPE class. Frames
+    without people skip stage two.
+    """
+    persons = detect(person_model, frame, person_preprocessor, person_options or {"classes": [PERSON_CLASS_ID], "verbose": False})
+    keep = (persons.cls == PERSON_CLASS_ID) & (persons.conf >= person_conf)
+    person_xyxy, person_conf_values = persons.xyxy[keep], persons.conf[keep]
+
+    if not len(person_xyxy):
+        return Detections(person_xyxy, person_conf_values, np.full(0, person_class_id))
+
+    # Highest confidence people first when there are more than one batch can hold
+    order = np.argsort(-person_conf_values)[:PPE_MAX_CROPS]
+    height, width = frame.shape[:2]
+    offsets, metas, cropped = [], [], []
+    for index, (x1, y1, x2, y2) in zip(order, person_xyxy[order]):
+        margin_x, margin_y = (x2 - x1) * PPE_CROP_MARGIN, (y2 - y1) * PPE_CROP_MARGIN
+        x1, y1 = int(max(0, x1 - margin_x)), int(max(0, y1 - margin_y))
+        x2, y2 = int(min(width, x2 + margin_x)), int(min(height, y2 + margin_y))
+        if x2 - x1 < 2 or y2 - y1 < 2:
             continue
-
-    if not person_boxes:
-        print("No persons detected in the frame. Skipping PPE detection.")
-        return frame, [], detected_classes
-
-    # Step 2: Detect PPE and associate with corresponding person bounding boxes
-    for det in detections:
-        try:
-            box = det.xyxy[0].tolist() 
-            conf = det.conf[0].item()
-            cls = int(det.cls[0].item())
-            class_name = model.names[cls]
-
-            if conf >= zoneconf and class_name in zonescenarios:
-                for person in person_boxes:
-                    person_box = person['box']
-                    if is_within_person_box(box, person_box):
-                        pt1 = (int(box[0]), int(box[1]))
-                        pt2 = (int(box[2]), int(box[3]))
-                        cv2.rectangle(frame, pt1, pt2, (0, 255, 0), 2)  
-                        label = f'{class_name} {conf:.2f}'
-                        cv2.putText(frame, label, (int(box[0]), int(box[1]) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                        
-        
-                        person['detected_ppe'].append(class_name)
-                        if class_name in person['missing_ppe']:
-                            person['missing_ppe'].remove(class_name)
-
-        except Exception as e:
-            print(f"Error processing PPE detection: {e}")
-            continue
-
-    missing_classes = []
-    for person in person_boxes:
-        if person['missing_ppe']:
-            missing_classes.append({
-                'person_box': person['box'],
-                'missing_ppe': list(person['missing_ppe'])
-            })
-
-    return frame, missing_classes, detected_classes
-
-def save_detections(db, missing_classes, buffer, record_id, detected_classes):
-    debounce_time_seconds = 1 * 60  
-    current_timestamp = datetime.datetime.now(datetime.timezone.utc)
-
-    if missing_classes:
-        missing_ppe_list = [','.join(person['missing_ppe']) for person in missing_classes if person['missing_ppe']]
-        
-        if not missing_ppe_list:
-            return  
-        
-        
-        cache_key = f"{record_id}_{','.join(missing_ppe_list)}"  
-
-        if should_skip_detection(cache_key, db, record_id, cache_key, current_timestamp, debounce_time_seconds):
-            return
-
-        save_detection(db, buffer, record_id, missing_ppe_list, current_timestamp, cache_key, detected_classes)
-
-
-def save_detection(db, buffer, record_id, missing_classes, current_timestamp, cache_key, detected_classes):
-    detection_cache[cache_key] = current_timestamp
-
-    missing_classes_str = ','.join(missing_classes)
-    
-    db_detection = Incident(
-        recording_id=record_id,
-        class_name=missing_classes_str,  
-        confidence=0.0,  
-        bbox='', 
-        frame=buffer.tobytes(),
-        timestamp=current_timestamp
-    )
-
-    try:
-        db.add(db_detection)
-        db.commit()
-        print(f"Missing detection saved to DB: {db_detection}")
-    except Exception as e:
-        print(f"Error saving to DB: {e}")
-        db.rollback()
-
-@celery_app.task(bind=True)
+        metas.append(crop_preprocessor(frame[y1:y2, x1:x2], index=len(metas)))
+        offsets.append((x1, y1, x1, y1))
+        cropped.append(index)
+
+    xyxy, conf, cls = [person_xyxy[cropped]], [person_conf_values[cropped]], [np.full(len(cropped), person_class_id)]
+    results = model(crop_preprocessor.tensor_batch(len(metas)), **(options or {})) if metas else []
+    for result, meta, offset in zip(results, metas, offsets):
+        crop_detections = detections_from_result(result, meta)
+        # People are already known from stage one
+        ppe = crop_detections.cls != person_class_id
+        xyxy.append(crop_detections.xyxy[ppe] + np.array(offset, dtype=crop_detections.xyxy.dtype))
+        conf.append(crop_detections.conf[ppe])
+        cls.append(crop_detections.cls[ppe])
+
+    return Detections(np.concatenate(xyxy), np.concatenate(conf), np.concatenate(cls))
+
+
+def two_stage_detector(model, profile, options, context):
+    person_class_id = next((cls for cls, name in model.names.items() if name == 'person'), None)
+    if person_class_id is None:
+        raise ValueError(f"Two-stage PPE detection needs a person class in the PPE model, it has {sorted(model.names.values())}")
+
+    person_model = get_model(PERSON_MODEL_PATH)
+    # Every setting is passed, the person detector may be a cached model shared with other streams
+    person_options = {**inference_options(person_model, DEFAULT_PROFILE), "classes": [PERSON_CLASS_ID]}
+    preprocessor = LetterboxPreprocessor(model_input_size(person_model))
+    crop_preprocessor = LetterboxPreprocessor(PPE_CROP_SIZE, batch_size=PPE_MAX_CROPS)
+    return lambda frame: detect_two_stage(person_model, model, frame, preprocessor, crop_preprocessor, context.confidence,
+                                          person_class_id, options, person_options)
+
+
+@celery_app.task(bind=True, **STREAM_TASK_OPTIONS)
 def run_ppe_detection(self, camera_id, model_path, record_id):
-    db = SessionLocal()
-    
-    frame_skip_interval = 20
-    frame_count = 0
-
-    try:
-        model = YOLO(model_path)
-        cap = initialize_camera(crud.get_camera_by_id(db, camera_id).ipaddress, "./yolomodels/testvideo.mp4")
-        confidence = crud.get_recording(db=db, recording_id=record_id).confidence / 100 or crud.get_zone_confidence_level(db, camera_id)
-        recordingscenarios = crud.get_zone_scenario(db=db, recording_id=record_id)
-        
-        while True:
-            start_time = time.time()
-
-            ret, frame = cap.read()  
-            if not ret:
-                break 
-
-            frame_count += 1
-
-            if frame_count % frame_skip_interval != 0:
-                continue
-
-            frame = process_frame(cap)
-            frame, missing_classes, detected_classes = handle_detections_with_multiple_persons(model, frame, confidence, recordingscenarios)
-
-            buffer = cv2.imencode('.jpg', frame)[1]
-            save_detections(db, missing_classes, buffer, record_id, detected_classes)
-
-            elapsed_time = time.time() - start_time
-            time.sleep(max(0, 0.1 - elapsed_time))
-
-    except Exception as e:
-        cap.release()
-        raise self.retry(exc=e, countdown=10)  
-
-    finally:
-        db.close()
-
+    run_rule_stream(self, camera_id, model_path, record_id, PPE_RULES, "./yolomodels/testvideo.mp4", frame_skip=20,
+                    detector_factory=two_stage_detector if PPE_TWO_STAGE else default_detector)
 
 
 globals()['run_ppe_detection'] = run_ppe_detection
@@ -0,0 +1,93 @@
+#preprocess.py
+import math
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# Where the frame was placed on the model input, used to map boxes back to frame coordinates
+LetterboxMeta = namedtuple("LetterboxMeta", ["scale", "pad_x", "pad_y", "width", "height"])
+
+MODEL_STRIDE = 32
+PAD_VALUE = 114
+# Resize buffers kept per preprocessor, a camera stream only ever needs one
+MAX_CACHED_SHAPES = 4
+
+
+def model_input_size(model, default=640):
+    """Square input size the model was trained with."""
+    args = getattr(getattr(model, 'model', None), 'args', None) or {}
+    imgsz = args.get('imgsz', default) if isinstance(args, dict) else default
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz)
+    return int(imgsz)
+
+
+class LetterboxPreprocessor:
+    """
+    Builds the model input tensor straight from the captured frame: one aspect-preserving resize
+    into the padded canvas, then BGR uint8 HWC to RGB float CHW into a preallocated tensor.
+    All buffers are allocated once and reused for every frame of the stream.
+    """
+
+    def __init__(self, imgsz=640, batch_size=1, device='cpu'):
+        # Imported here so that importing the task modules does not load torch
+        import torch
+
+        self.imgsz = math.ceil(imgsz / MODEL_STRIDE) * MODEL_STRIDE
+        self.batch_size = batch_size
+        self.canvas = np.full((batch_size, self.imgsz, self.imgsz, 3), PAD_VALUE, dtype=np.uint8)
+        self.tensor = torch.zeros((batch_size, 3, self.imgsz, self.imgsz), dtype=torch.float32, device=device)
+        # NCHW view sharing memory with the canvas, no copy
+        self._canvas_nchw = torch.from_numpy(self.canvas).permute(0, 3, 1, 2)
+        self._slot_meta = [None] * batch_size
+        self._resized = {}
+
+    def layout(self, height, width):
+        scale = min(self.imgsz / height, self.imgsz / width)
+        new_width, new_height = round(width * scale), round(height * scale)
+        pad_x = (self.imgsz - new_width) // 2
+        pad_y = (self.imgsz - new_height) // 2
+        return LetterboxMeta(scale, pad_x, pad_y, width, height)
+
+    def __call__(self, frame, index=0):
+        """Letterbox frame into slot index of the batch and return its LetterboxMeta."""
+        height, width = frame.shape[:2]
+        meta = self.layout(height, width)
+        canvas = self.canvas[index]
+
+        # The padding only has to be redrawn when the frame geometry changes
+        if self._slot_meta[index] != meta:
+            canvas[:] = PAD_VALUE
+            self._slot_meta[index] = meta
+
+        new_width, new_height = round(width * meta.scale), round(height * meta.scale)
+        region = canvas[meta.pad_y:meta.pad_y + new_height, meta.pad_x:meta.pad_x + new_width]
+
+        if (new_width, new_height) == (width, height):
+            region[:] = frame
+        else:
+            resized = self._resized.get((new_height, new_width))
+            if resized is None and len(self._resized) < MAX_CACHED_SHAPES:
+                resized = self._resized[(new_height, new_width)] = np.empty((new_height, new_width, 3), dtype=np.uint8)
+            # Inputs of ever-changing size (person crops) get a temporary buffer instead of a cached one
+            region[:] = cv2.resize(frame, (new_width, new_height), dst=resized, interpolation=cv2.INTER_LINEAR)
+
+        return meta
+
+    def tensor_batch(self, count=1):
+        """RGB float tensor of the first count slots, in [0, 1] as ultralytics expects for tensor input."""
+        tensor = self.tensor[:count]
+        for dst_channel, src_channel in enumerate((2, 1, 0)):
+            tensor[:, dst_channel].copy_(self._canvas_nchw[:count, src_channel])
+        return tensor.div_(255.0)
+
+
+def scale_boxes_to_frame(xyxy, meta):
+    """Map xyxy boxes from model input coordinates back to the original frame, in place."""
+    xs, ys = xyxy[:, 0::2], xyxy[:, 1::2]
+    xs -= meta.pad_x
+    ys -= meta.pad_y
+    xyxy /= meta.scale
+    np.clip(xs, 0, meta.width, out=xs)
+    np.clip(ys, 0, meta.height, out=ys)
+    return xyxy
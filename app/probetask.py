@@ -0,0 +1,12 @@
+#probetask.py
+from app.camerahealth import probe_open_cameras
+from app.celery import celery_app
+
+
+@celery_app.task
+def probe_camera_health():
+    """Probe the cameras with an open circuit whose backoff has elapsed, see app.camerahealth."""
+    probed, recovered = probe_open_cameras()
+    if probed:
+        print(f"Probed {probed} camera(s), {recovered} healthy again.")
+    return {"probed": probed, "recovered": recovered}
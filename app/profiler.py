@@ -0,0 +1,147 @@
+#profiler.py
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Where the pool children write their profiles, on the worker's host
+PROFILE_DIR = os.getenv("STREAM_PROFILE_DIR", "/tmp/streamprofiles")
+# Seconds between two stack samples
+PROFILE_INTERVAL = float(os.getenv("STREAM_PROFILE_INTERVAL", 0.01))
+MAX_PROFILE_SECONDS = 600
+# A request not picked up within this time is dropped, e.g. because the stream ended
+PROFILE_REQUEST_TTL = 60
+# Seconds between two request lookups of a stream that publishes no stats heartbeat
+PROFILE_POLL_INTERVAL = float(os.getenv("STREAM_PROFILE_POLL_INTERVAL", 5))
+
+_active_sampler = None
+
+
+def request_key(pid):
+    return f"streamprofile:pid:{pid}"
+
+
+def frame_label(frame):
+    code = frame.f_code
+    filename = code.co_filename
+    # Keep package-relative paths, the site-packages prefix only adds noise
+    for prefix in sorted((p for p in sys.path if p), key=len, reverse=True):
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Frames from the outermost to frame, joined the way flamegraph.pl and speedscope read them."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def summarise(stacks, top=40):
+    """Per-function self and inclusive sample counts, most expensive first."""
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] += count
+        for label in set(frames):
+            total_counts[label] += count
+
+    samples = sum(stacks.values()) or 1
+    lines = [f"{samples} samples", f"{'self %':>7} {'total %':>8}  function"]
+    for label, count in self_counts.most_common(top):
+        lines.append(f"{100 * count / samples:>7.1f} {100 * total_counts[label] / samples:>8.1f}  {label}")
+    lines.append("")
+    lines.append(f"{'total %':>8}  function (inclusive)")
+    for label, count in total_counts.most_common(top):
+        lines.append(f"{100 * count / samples:>8.1f}  {label}")
+    return "\n".join(lines) + "\n"
+
+
+def write_profile(stacks, path_prefix):
+    """Write path_prefix.folded (collapsed stacks) and path_prefix.txt (summary), returns both paths."""
+    os.makedirs(os.path.dirname(path_prefix) or ".", exist_ok=True)
+    folded_path, summary_path = f"{path_prefix}.folded", f"{path_prefix}.txt"
+    with open(folded_path, "w") as folded:
+        for stack, count in stacks.most_common():
+            folded.write(f"{stack} {count}\n")
+    with open(summary_path, "w") as summary:
+        summary.write(summarise(stacks))
+    return folded_path, summary_path
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread every interval seconds from a daemon thread. Only runs while
+    a profile was asked for, a stream that is not being profiled pays nothing.
+    """
+
+    def __init__(self, thread_id, seconds, path_prefix, interval=PROFILE_INTERVAL):
+        super().__init__(name="stream-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.seconds = min(seconds, MAX_PROFILE_SECONDS)
+        self.path_prefix = path_prefix
+        self.interval = interval
+        self.stacks = Counter()
+
+    def run(self):
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            self.stacks[collapse_stack(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+
+        folded_path, summary_path = write_profile(self.stacks, self.path_prefix)
+        print(f"Profile of {sum(self.stacks.values())} samples written to {folded_path} and {summary_path}.")
+
+
+def start_profile(seconds, label):
+    """Profile the main thread of this process for seconds, unless a profile is already running."""
+    global _active_sampler
+    if _active_sampler is not None and _active_sampler.is_alive():
+        print("A profile is already running in this process.")
+        return None
+
+    path_prefix = os.path.join(PROFILE_DIR, f"{label}-pid{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}")
+    _active_sampler = StackSampler(threading.main_thread().ident, seconds, path_prefix)
+    _active_sampler.start()
+    print(f"Profiling for {_active_sampler.seconds}s into {path_prefix}.*")
+    return path_prefix
+
+
+def request_profile(client, pid, seconds):
+    """Ask the pool child pid to profile itself, it picks the request up with its next stats heartbeat or poll."""
+    client.set(request_key(pid), seconds, ex=PROFILE_REQUEST_TTL)
+
+
+def poll_profile_request(client, label):
+    """Start a profile if one was requested for this process. One GET per stats heartbeat or poll."""
+    pipe = client.pipeline()
+    pipe.get(request_key(os.getpid()))
+    pipe.delete(request_key(os.getpid()))
+    seconds, _ = pipe.execute()
+    if seconds is not None:
+        start_profile(float(seconds), label)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the per-function summary of a collapsed-stack profile.")
+    parser.add_argument("folded")
+    parser.add_argument("--top", type=int, default=40)
+    args = parser.parse_args()
+
+    stacks = Counter()
+    with open(args.folded) as folded:
+        for line in folded:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            stacks[stack] += int(count)
+    print(summarise(stacks, args.top), end="")
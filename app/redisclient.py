@@ -0,0 +1,16 @@
+#redisclient.py
+import os
+
+# Redis used for worker-side state (stream stats, ...), the Celery broker by default
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+
+_clients = {}
+
+
+def get_redis(url=REDIS_URL):
+    """One client (and connection pool) per URL and process."""
+    client = _clients.get(url)
+    if client is None:
+        import redis
+        client = _clients[url] = redis.Redis.from_url(url)
+    return client
@@ -0,0 +1,143 @@
+#retentiontask.py
+import os
+import time
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+from sqlalchemy import exists, select
+from sqlalchemy.orm import aliased
+
+from app.celery import celery_app
+from app.database import SessionLocal
+from app.models import Incident, Plant, Recording, RetentionPolicy, Zone
+
+# Defaults for plants without a RetentionPolicy row
+FULL_FRAME_DAYS = int(os.getenv("RETENTION_FULL_FRAME_DAYS", 30))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 365))
+# Rows touched per transaction, small enough that the stream tasks never wait long on a lock
+BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE", 0.1))
+THUMBNAIL_WIDTH = int(os.getenv("RETENTION_THUMBNAIL_WIDTH", 320))
+THUMBNAIL_QUALITY = int(os.getenv("RETENTION_THUMBNAIL_QUALITY", 70))
+
+
+def make_thumbnail(frame_bytes, width=THUMBNAIL_WIDTH, quality=THUMBNAIL_QUALITY):
+    """Downscaled, re-encoded JPEG, or None if the frame cannot be decoded."""
+    image = cv2.imdecode(np.frombuffer(frame_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+
+    if image.shape[1] > width:
+        height = round(image.shape[0] * width / image.shape[1])
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def plant_recording_ids(plant_id):
+    """
+    Select of the recordings of a plant. None selects the recordings that belong to no plant:
+    no zone, a zone that no longer exists, a zone without a plant or with a deleted plant.
+    """
+    if plant_id is None:
+        return select(Recording.id).outerjoin(Zone, Recording.zone_id == Zone.id) \
+            .where(Zone.plant_id.is_(None) | Zone.plant_id.notin_(select(Plant.id)))
+    return select(Recording.id).join(Zone, Recording.zone_id == Zone.id).where(Zone.plant_id == plant_id)
+
+
+def plant_incidents(plant_id):
+    """Filter on the incidents of a plant. The no-plant bucket also takes the orphan incidents, without a recording."""
+    if plant_id is None:
+        return Incident.recording_id.in_(plant_recording_ids(None)) | Incident.recording_id.is_(None) \
+            | Incident.recording_id.notin_(select(Recording.id))
+    return Incident.recording_id.in_(plant_recording_ids(plant_id))
+
+
+def get_policies(db):
+    """(plant_id, fullframedays, retentiondays) for every plant, then the defaults for recordings without a plant."""
+    policies = {policy.plant_id: policy for policy in db.query(RetentionPolicy)}
+    result = []
+    for (plant_id,) in db.query(Plant.id).order_by(Plant.id):
+        policy = policies.get(plant_id)
+        result.append((
+            plant_id,
+            policy.fullframedays if policy and policy.fullframedays is not None else FULL_FRAME_DAYS,
+            policy.retentiondays if policy and policy.retentiondays is not None else RETENTION_DAYS,
+        ))
+    result.append((None, FULL_FRAME_DAYS, RETENTION_DAYS))
+    return result
+
+
+def compact_frames(db, incidents, cutoff, stats, batch_size=BATCH_SIZE):
+    """Replace the frames of incidents older than cutoff by thumbnails, batch by batch."""
+    while True:
+        rows = db.query(Incident.id, Incident.frame).filter(
+            incidents,
+            Incident.timestamp < cutoff,
+            Incident.framecompacted.isnot(True),
+            Incident.frame.isnot(None),
+        ).order_by(Incident.id).limit(batch_size).all()
+        if not rows:
+            return
+
+        for incident_id, frame in rows:
+            thumbnail = make_thumbnail(frame)
+            values = {Incident.framecompacted: True}
+            if thumbnail is not None and len(thumbnail) < len(frame):
+                values[Incident.frame] = thumbnail
+                stats["bytes_saved"] += len(frame) - len(thumbnail)
+            db.query(Incident).filter(Incident.id == incident_id).update(values, synchronize_session=False)
+
+        db.commit()
+        stats["compacted"] += len(rows)
+        print(f"Retention: compacted {stats['compacted']} frame(s) so far, {stats['bytes_saved'] / 2**20:.1f} MB saved.")
+        time.sleep(BATCH_PAUSE_SECONDS)
+
+
+def delete_expired(db, incidents, cutoff, stats, batch_size=BATCH_SIZE):
+    """
+    Delete incidents older than cutoff, batch by batch. Portable SQL only, no DELETE ... LIMIT.
+    An incident whose frame is still referenced by a deduplicated one is kept until that one goes.
+    """
+    referrer = aliased(Incident)
+    while True:
+        incident_ids = [incident_id for (incident_id,) in db.query(Incident.id).filter(
+            incidents,
+            Incident.timestamp < cutoff,
+            ~exists().where(referrer.frameref_id == Incident.id),
+        ).order_by(Incident.id).limit(batch_size)]
+        if not incident_ids:
+            return
+
+        db.query(Incident).filter(Incident.id.in_(incident_ids)).delete(synchronize_session=False)
+        db.commit()
+        stats["deleted"] += len(incident_ids)
+        print(f"Retention: deleted {stats['deleted']} incident(s) so far.")
+        time.sleep(BATCH_PAUSE_SECONDS)
+
+
+def apply_retention(db, now=None, batch_size=BATCH_SIZE):
+    """Run every plant's policy, returns the per-plant counters."""
+    now = now or datetime.utcnow()
+    report = []
+    for plant_id, full_frame_days, retention_days in get_policies(db):
+        started = time.monotonic()
+        stats = {"plant_id": plant_id, "compacted": 0, "deleted": 0, "bytes_saved": 0}
+        incidents = plant_incidents(plant_id)
+
+        # Delete first so no time is spent compacting frames that are about to go
+        delete_expired(db, incidents, now - timedelta(days=retention_days), stats, batch_size)
+        compact_frames(db, incidents, now - timedelta(days=full_frame_days), stats, batch_size)
+
+        stats["seconds"] = round(time.monotonic() - started, 2)
+        report.append(stats)
+        print(f"Retention for plant {plant_id}: {stats}")
+    return report
+
+
+@celery_app.task
+def run_incident_retention():
+    db = SessionLocal()
+    try:
+        return apply_retention(db)
+    finally:
+        db.close()
@@ -0,0 +1,291 @@
+#rules.py
+import json
+import os
+from collections import namedtuple
+import cv2
+import numpy as np
+
+from app.capture import FRAME_SIZE
+
+# What a rule found on one frame. key identifies it for confirmation (unique across the rule set),
+# class_name is the incident class, boxes are the xyxy boxes involved and region their union.
+Violation = namedtuple("Violation", ["rule", "key", "class_name", "confidence", "boxes", "region"])
+
+# Per-stream inputs of the rules: the confidence threshold of the recording/zone and its scenarios
+RuleContext = namedtuple("RuleContext", ["confidence", "scenarios"])
+
+RULE_TYPES = {}
+
+DETECTION_COLOUR = (255, 0, 0)
+VIOLATION_COLOUR = (0, 0, 255)
+# Stored incident frames are downscaled to this width, whatever the camera resolution
+INCIDENT_FRAME_WIDTH = int(os.getenv("INCIDENT_FRAME_WIDTH", FRAME_SIZE[0]))
+
+
+def rule_type(name):
+    """Register a rule class under the type name used in rule configs."""
+    def register(cls):
+        cls.type = name
+        RULE_TYPES[name] = cls
+        return cls
+    return register
+
+
+def region_of(boxes):
+    return (float(boxes[:, 0].min()), float(boxes[:, 1].min()), float(boxes[:, 2].max()), float(boxes[:, 3].max()))
+
+
+class Rule:
+    """
+    A rule reads the detection table of a frame (Detections: xyxy, conf, cls arrays) and returns
+    its violations. Rules only use array operations, never a Python loop per box.
+    """
+
+    def __init__(self, min_confidence=None, name=None):
+        self.min_confidence = min_confidence
+        self.name = name or self.type
+
+    def threshold(self, context):
+        return self.min_confidence if self.min_confidence is not None else context.confidence
+
+    def classes(self, context):
+        """Class names the rule needs from the model."""
+        raise NotImplementedError
+
+    def evaluate(self, detections, ids, frame_width, context):
+        """ids maps class names to model class ids. Returns a list of Violation."""
+        raise NotImplementedError
+
+    def incidents(self, violations):
+        """(class_name, confidence, region) of the incidents raised by the confirmed violations of this rule."""
+        return [(v.class_name, v.confidence, v.region) for v in violations]
+
+    def select(self, detections, ids, names, context):
+        """Mask of the detections of names above the threshold."""
+        wanted = [ids[name] for name in names if name in ids]
+        return np.isin(detections.cls, wanted) & (detections.conf >= self.threshold(context))
+
+
+@rule_type("presence")
+class PresenceRule(Rule):
+    """Raises when any of classes is detected, e.g. a bad pallet."""
+
+    def __init__(self, classes, incident=None, **kwargs):
+        super().__init__(**kwargs)
+        self.class_names = list(classes)
+        self.incident = incident
+
+    def classes(self, context):
+        return set(self.class_names)
+
+    def evaluate(self, detections, ids, frame_width, context):
+        mask = self.select(detections, ids, self.class_names, context)
+        violations = []
+        for class_name in self.class_names:
+            if class_name not in ids:
+                continue
+            found = mask & (detections.cls == ids[class_name])
+            if found.any():
+                boxes = detections.xyxy[found]
+                violations.append(Violation(self, f"{self.name}:{class_name}", self.incident or class_name,
+                                            float(detections.conf[found].max()), boxes, region_of(boxes)))
+        return violations
+
+
+@rule_type("ppe")
+class PPEContainmentRule(Rule):
+    """
+    Every person must contain each required PPE class: a PPE box counts for a person when it lies
+    entirely inside the person box. required defaults to the scenarios of the recording. One
+    violation per missing class, merged into a single incident listing every missing class.
+    """
+
+    def __init__(self, required=None, person="person", **kwargs):
+        super().__init__(**kwargs)
+        self.required = list(required) if required else None
+        self.person = person
+
+    def required_classes(self, context):
+        return self.required if self.required is not None else list(context.scenarios)
+
+    def classes(self, context):
+        return {self.person, *self.required_classes(context)}
+
+    def evaluate(self, detections, ids, frame_width, context):
+        persons = self.select(detections, ids, [self.person], context)
+        if not persons.any():
+            return []
+
+        person_boxes = detections.xyxy[persons]
+        violations = []
+        for class_name in self.required_classes(context):
+            ppe_boxes = detections.xyxy[self.select(detections, ids, [class_name], context)]
+            # (persons, ppe) containment matrix
+            inside = ((ppe_boxes[None, :, 0] >= person_boxes[:, None, 0]) & (ppe_boxes[None, :, 1] >= person_boxes[:, None, 1]) &
+                      (ppe_boxes[None, :, 2] <= person_boxes[:, None, 2]) & (ppe_boxes[None, :, 3] <= person_boxes[:, None, 3]))
+            missing = ~inside.any(axis=1)
+            if missing.any():
+                boxes = person_boxes[missing]
+                violations.append(Violation(self, f"{self.name}:{class_name}", class_name,
+                                            float(detections.conf[persons][missing].max()), boxes, region_of(boxes)))
+        return violations
+
+    def incidents(self, violations):
+        if not violations:
+            return []
+        boxes = np.concatenate([v.boxes for v in violations])
+        return [(','.join(sorted(v.class_name for v in violations)), max(v.confidence for v in violations), region_of(boxes))]
+
+
+@rule_type("proximity")
+class ProximityRule(Rule):
+    """Raises when the centres of a first and a second class box are closer than distance, in pixels of a 640 wide frame."""
+
+    def __init__(self, first="person", second="forklift", distance=350, incident=None, **kwargs):
+        super().__init__(**kwargs)
+        self.first = first
+        self.second = second
+        self.distance = distance
+        self.incident = incident or f"{first}_{second}_proximity"
+
+    def classes(self, context):
+        return {self.first, self.second}
+
+    def evaluate(self, detections, ids, frame_width, context):
+        first = self.select(detections, ids, [self.first], context)
+        second = self.select(detections, ids, [self.second], context)
+        if not first.any() or not second.any():
+            return []
+
+        first_boxes, second_boxes = detections.xyxy[first], detections.xyxy[second]
+        first_centres = (first_boxes[:, :2] + first_boxes[:, 2:]) / 2
+        second_centres = (second_boxes[:, :2] + second_boxes[:, 2:]) / 2
+        distances = np.linalg.norm(first_centres[:, None, :] - second_centres[None, :, :], axis=2)
+        close = distances < self.distance * frame_width / FRAME_SIZE[0]
+        if not close.any():
+            return []
+
+        pairs = np.nonzero(close)
+        boxes = np.concatenate([first_boxes[np.unique(pairs[0])], second_boxes[np.unique(pairs[1])]])
+        confidence = float(min(detections.conf[first].max(), detections.conf[second].max()))
+        return [Violation(self, f"{self.name}:{self.incident}", self.incident, confidence, boxes, region_of(boxes))]
+
+
+class RuleSet:
+    """The rules of one stream, evaluated together over one detection table per frame."""
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def classes(self, context):
+        names = set()
+        for rule in self.rules:
+            names |= rule.classes(context)
+        return tuple(sorted(names))
+
+    def evaluate(self, detections, names, frame_width, context):
+        ids = {name: cls for cls, name in names.items()}
+        violations = []
+        for rule in self.rules:
+            violations.extend(rule.evaluate(detections, ids, frame_width, context))
+        return violations
+
+    def incidents(self, violations):
+        """Turn confirmed violations into (class_name, confidence, region) incidents, rule by rule."""
+        incidents = []
+        for rule in self.rules:
+            incidents.extend(rule.incidents([v for v in violations if v.rule is rule]))
+        return incidents
+
+    def annotate(self, frame, detections, names, violations, context):
+        """
+        Draw the detections the rules look at, then the boxes of the violations on top. Lines and
+        labels grow with the frame, so they keep their size once it is downscaled by encode_frame.
+        """
+        scale = max(1.0, frame.shape[1] / INCIDENT_FRAME_WIDTH)
+        font_scale, thickness = 0.5 * scale, max(1, round(2 * scale))
+        ids = {name: cls for cls, name in names.items()}
+        wanted = [ids[name] for name in self.classes(context) if name in ids]
+        shown = np.isin(detections.cls, wanted) & (detections.conf >= context.confidence)
+        for (x1, y1, x2, y2), conf, cls in zip(detections.xyxy[shown].astype(int).tolist(),
+                                               detections.conf[shown].tolist(), detections.cls[shown].tolist()):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), DETECTION_COLOUR, thickness)
+            cv2.putText(frame, f'{names[cls]} {conf:.2f}', (x1, y1 - round(10 * scale)), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, DETECTION_COLOUR, thickness)
+        for violation in violations:
+            for x1, y1, x2, y2 in violation.boxes.astype(int).tolist():
+                cv2.rectangle(frame, (x1, y1), (x2, y2), VIOLATION_COLOUR, thickness)
+            x1, y1 = int(violation.region[0]), int(violation.region[1])
+            cv2.putText(frame, violation.class_name, (x1, max(y1 - round(24 * scale), round(10 * scale))),
+                        cv2.FONT_HERSHEY_SIMPLEX, font_scale, VIOLATION_COLOUR, thickness)
+        return frame
+
+
+def encode_frame(frame, width=INCIDENT_FRAME_WIDTH):
+    """JPEG buffer of an annotated frame, downscaled to at most width pixels wide."""
+    if frame.shape[1] > width:
+        height = round(frame.shape[0] * width / frame.shape[1])
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.jpg', frame)[1]
+
+
+# Rule sets of the built-in detection types, used when DetectionType.rules is empty
+PPE_RULES = [{"type": "ppe"}]
+PALLET_RULES = [{"type": "presence", "classes": ["Pallets_bad"]}]
+PROXIMITY_RULES = [{"type": "proximity", "first": "person", "second": "forklift", "distance": 350,
+                    "incident": "person_forklift_proximity"}]
+
+DEFAULT_RULES = {
+    "run_ppe_detection": PPE_RULES,
+    "run_pallet_detection": PALLET_RULES,
+    "run_proximity_detection": PROXIMITY_RULES,
+    "ppe": PPE_RULES,
+    "pallet": PALLET_RULES,
+    "forklift": PROXIMITY_RULES,
+}
+
+
+def build_rules(config):
+    """RuleSet from a list of rule dicts (or its JSON), each with a type and that rule's arguments."""
+    if isinstance(config, str):
+        config = json.loads(config)
+
+    rules = []
+    for entry in config:
+        entry = dict(entry)
+        rule_class = RULE_TYPES.get(entry.pop("type", None))
+        if rule_class is None:
+            raise ValueError(f"Unknown rule type in {config}, known types are {sorted(RULE_TYPES)}")
+        try:
+            rules.append(rule_class(**entry))
+        except TypeError as e:
+            raise ValueError(f"Invalid arguments for rule type {rule_class.type} in {config}: {e}") from e
+
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Rules of one set need distinct names, got {names}")
+    return RuleSet(rules)
+
+
+def rule_config(detection_type, default=None):
+    """The stored rule config of a detection type, else the built-in one for its task."""
+    if detection_type is not None and detection_type.rules:
+        return json.loads(detection_type.rules)
+    if default is None and detection_type is not None:
+        default = DEFAULT_RULES.get(detection_type.task_name)
+    if default is None:
+        raise ValueError("Detection type has no rules and no built-in rule set")
+    return default
+
+
+def get_rule_config(db, record_id, default=None):
+    """Rule config of the detection type of a recording, plain data that can be sent to other tasks."""
+    from app.models import DetectionType, Recording
+
+    detection_type = db.query(DetectionType).join(Recording, Recording.detection_type_id == DetectionType.id) \
+        .filter(Recording.id == record_id).first()
+    return rule_config(detection_type, default)
+
+
+def get_rules(db, record_id, default=None):
+    return build_rules(get_rule_config(db, record_id, default))
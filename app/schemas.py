@@ -13,13 +13,17 @@ class PlantStatusEnum(str, Enum):
     active = "active"
     inactive = "inactive"
 
+class CaptureBackendEnum(str, Enum):
+    opencv = "opencv"
+    ffmpeg = "ffmpeg"
+    framebus = "framebus"
+
 class Incident(BaseModel):
     id: int 
     timestamp: datetime.date
     class_name: str
     confidence: str
     bbox: str
-    frame: str
     recording_id: int
 
     class Config:
@@ -27,6 +31,25 @@ class Incident(BaseModel):
         populate_by_name = True
         arbitrary_types_allowed = True
 
+class ReadIncident(BaseModel):
+    id: int
+    timestamp: datetime.datetime
+    class_name: str
+    confidence: Optional[float]
+    bbox: Optional[str]
+    recording_id: int
+    frameref_id: Optional[int] = None
+    occurrences: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+        populate_by_name = True
+        arbitrary_types_allowed = True
+
+class IncidentPage(BaseModel):
+    items: list[ReadIncident]
+    next_cursor: Optional[str]
+
 
 class ReadRecording(BaseModel):
     id: int
@@ -65,6 +88,7 @@ class Camera(BaseModel):
     name: str
     description: str
     ipaddress: str
+    capturebackend: Optional[CaptureBackendEnum] = CaptureBackendEnum.opencv
     zone_id: int
     recordings: list[ReadRecording] = []
 
@@ -78,6 +102,7 @@ class ReadCamera(BaseModel):
     name: str
     description: str
     ipaddress: str
+    capturebackend: Optional[CaptureBackendEnum] = CaptureBackendEnum.opencv
     zone_id: int
     recordings: list[ReadRecording] = []
 
@@ -90,6 +115,7 @@ class CreateCamera(BaseModel):
     name: str
     description: str
     ipaddress: str
+    capturebackend: CaptureBackendEnum = CaptureBackendEnum.opencv
     zone_id: int
 
     class Config:
@@ -101,6 +127,7 @@ class CreateZoneCamera(BaseModel):
     name: str
     description: str
     ipaddress: str
+    capturebackend: CaptureBackendEnum = CaptureBackendEnum.opencv
     class Config:
         from_attributes = True
         populate_by_name = True
@@ -239,12 +266,28 @@ class ReadDetectionType(BaseModel):
     id: int 
     name: str
     description: str 
+    classes: Optional[str] = None
+    imgsz: Optional[int] = None
+    iou: Optional[float] = None
+    minconfidence: Optional[float] = None
+    maxdet: Optional[int] = None
+    rules: Optional[str] = None
 
     class Config:
         from_attributes = True
         populate_by_name = True
         arbitrary_types_allowed = True
 
+class InferenceProfile(BaseModel):
+    classes: Optional[str] = None
+    imgsz: Optional[int] = None
+    iou: Optional[float] = None
+    minconfidence: Optional[float] = None
+    maxdet: Optional[int] = None
+
+class DetectionRules(BaseModel):
+    rules: list[dict]
+
 class CreateInstance(BaseModel):
     recording: CreateRecording
     scenarios: list[ReadScenario]
@@ -0,0 +1,87 @@
+#streamstats.py
+import json
+import os
+import time
+
+from app.profiler import PROFILE_POLL_INTERVAL, poll_profile_request
+from app.redisclient import get_redis
+
+# Seconds between two heartbeats of a stream, 0 disables them
+STREAM_STATS_INTERVAL = float(os.getenv("STREAM_STATS_INTERVAL", 5))
+# A stream that stopped publishing disappears after this many seconds
+STREAM_STATS_TTL = int(os.getenv("STREAM_STATS_TTL", 60))
+
+
+def stats_key(record_id):
+    return f"streamstats:{record_id}"
+
+
+class StreamMonitor:
+    """Publishes throughput, lag and reconnect counters of a running stream to Redis every few seconds."""
+
+    def __init__(self, record_id, stream, interval=STREAM_STATS_INTERVAL):
+        self.record_id = record_id
+        self.stream = stream
+        self.interval = interval
+        self.processed = 0
+        self.loop_seconds = 0.0
+        self._window_started = time.monotonic()
+        self._window_processed = 0
+        self._window_frames = stream.stats["frames"]
+        self._last_profile_poll = time.monotonic()
+
+    def frame_processed(self, loop_seconds):
+        """Call once per processed frame with the time spent on it, excluding the pacing sleep."""
+        self.processed += 1
+        self.loop_seconds += loop_seconds
+        if not self.interval:
+            # Without heartbeats a profile request is still looked up, on its own interval
+            if time.monotonic() - self._last_profile_poll >= PROFILE_POLL_INTERVAL:
+                self.poll_profile()
+            return
+
+        elapsed = time.monotonic() - self._window_started
+        if elapsed >= self.interval:
+            self.publish(elapsed)
+
+    def poll_profile(self, client=None):
+        self._last_profile_poll = time.monotonic()
+        try:
+            poll_profile_request(client or get_redis(), f"stream-{self.record_id}")
+        except Exception as e:
+            print(f"Error polling profile requests: {e}")
+
+    def publish(self, elapsed):
+        processed = self.processed - self._window_processed
+        frames = self.stream.stats["frames"] - self._window_frames
+        lag = self.stream.lag_seconds()
+        stats = {
+            "pid": os.getpid(),
+            "updated": time.time(),
+            "processed_fps": processed / elapsed,
+            "capture_fps": frames / elapsed,
+            "loop_ms": 1000 * self.loop_seconds / self.processed if self.processed else 0.0,
+            "lag_seconds": lag,
+            "frames": self.stream.stats["frames"],
+            "reconnects": self.stream.stats.get("reconnects", 0),
+            "last_reconnect_seconds": self.stream.stats.get("last_reconnect_seconds", 0.0),
+        }
+
+        self._window_started = time.monotonic()
+        self._window_processed = self.processed
+        self._window_frames = self.stream.stats["frames"]
+
+        try:
+            client = get_redis()
+            client.set(stats_key(self.record_id), json.dumps(stats), ex=STREAM_STATS_TTL)
+        except Exception as e:
+            print(f"Error publishing stream stats: {e}")
+            return
+        self.poll_profile(client)
+
+
+def read_stream_stats(record_ids):
+    """Latest heartbeat of each stream, streams without a live heartbeat are left out."""
+    keys = [stats_key(record_id) for record_id in record_ids]
+    values = get_redis().mget(keys) if keys else []
+    return {record_id: json.loads(value) for record_id, value in zip(record_ids, values) if value}
@@ -0,0 +1,135 @@
+#streamtask.py
+import time
+from datetime import datetime, timezone
+
+from app import crud
+from app.camerahealth import wait_until_healthy
+from app.celery import celery_app, STREAM_TASK_OPTIONS
+from app.checkpoint import StreamCheckpoint, recycle_stream
+from app.commontasks import open_stream, should_skip_detection, save_incident, detection_cache, detect
+from app.confirmation import TemporalConfirmation
+from app.cpubudget import maybe_rebalance
+from app.database import SessionLocal
+from app.events import RecordingInfo
+from app.inferenceprofile import get_inference_profile, inference_options, input_size
+from app.modelcache import get_model
+from app.preprocess import LetterboxPreprocessor
+from app.rules import RuleContext, encode_frame, get_rules
+from app.streamstats import StreamMonitor
+
+DEBOUNCE_SECONDS = 60
+FALLBACK_VIDEO = "./yolomodels/testvideo.mp4"
+
+
+def default_detector(model, profile, options, context):
+    """Single model on the letterboxed frame, returns a function frame -> Detections."""
+    preprocessor = LetterboxPreprocessor(input_size(model, profile))
+    return lambda frame: detect(model, frame, preprocessor, options)
+
+
+def save_violations(db, record_id, rules, frame, detections, names, violations, context, debounce_seconds=DEBOUNCE_SECONDS,
+                    recording=None):
+    """Debounce the incidents of the confirmed violations, then annotate and encode the frame once for all of them."""
+    current_timestamp = datetime.now(timezone.utc)
+    incidents = []
+    for class_name, confidence, region in rules.incidents(violations):
+        cache_key = f"{record_id}_{class_name}"
+        if should_skip_detection(cache_key, db, record_id, class_name, current_timestamp, debounce_seconds):
+            continue
+        incidents.append((cache_key, class_name, confidence, region))
+
+    if not incidents:
+        return
+
+    rules.annotate(frame, detections, names, violations, context)
+    # The frame stays at camera resolution for the hash, only the stored JPEG is downscaled
+    buffer = encode_frame(frame)
+    for cache_key, class_name, confidence, region in incidents:
+        detection_cache[cache_key] = current_timestamp
+        db_detection = save_incident(db, record_id, class_name, confidence, buffer, current_timestamp, frame=frame, region=region,
+                                     recording=recording)
+        if db_detection is not None:
+            print(f"{class_name} incident saved to DB with confidence {confidence:.2f}: {db_detection}")
+
+
+def run_rule_stream(task, camera_id, model_path, record_id, default_rules=None, fallback_video=FALLBACK_VIDEO,
+                    frame_skip=1, detector_factory=default_detector):
+    """
+    The detection loop shared by every stream task: capture, one inference per processed frame,
+    the recording's rule set over the detection table, temporal confirmation, debounce and save.
+    Only every frame_skip-th frame is decoded and processed, the others are grabbed. default_rules
+    is the rule config used when the detection type stores none.
+    """
+    db = SessionLocal()
+    stream = None
+    frame_count = 0
+
+    try:
+        model = get_model(model_path)
+        recording = crud.get_recording(db=db, recording_id=record_id)
+        recording_info = RecordingInfo(recording.camera_id, recording.zone_id)
+        context = RuleContext(
+            confidence=recording.confidence / 100 or crud.get_zone_confidence_level(db, camera_id),
+            scenarios=crud.get_zone_scenario(db=db, recording_id=record_id),
+        )
+        rules = get_rules(db, record_id, default_rules)
+        # The model is only asked for the classes the rules look at
+        profile = get_inference_profile(db, record_id, default_classes=rules.classes(context))
+        detector = detector_factory(model, profile, inference_options(model, profile), context)
+
+        camera = crud.get_camera_by_id(db, camera_id)
+        stream = open_stream(camera.ipaddress, fallback_video, backend=camera.capturebackend, camera_id=camera_id)
+        monitor = StreamMonitor(record_id, stream)
+        checkpoint = StreamCheckpoint(record_id)
+        confirmation = TemporalConfirmation()
+        counters = checkpoint.restore(stream)
+        frame_count = counters.get("frame_count", frame_count)
+        confirmation.load(counters.get("confirmation"))
+
+        while True:
+            start_time = time.time()
+            maybe_rebalance()
+
+            frame_count += 1
+
+            if frame_count % frame_skip != 0:
+                stream.grab()
+                continue
+
+            frame = stream.read()
+            detections = detector(frame)
+            violations = rules.evaluate(detections, model.names, frame.shape[1], context)
+
+            # Only violations seen in k of the last n processed frames raise an incident
+            confirmed = confirmation.observe(violation.key for violation in violations)
+            if confirmed:
+                save_violations(db, record_id, rules, frame, detections, model.names,
+                                [violation for violation in violations if violation.key in confirmed], context,
+                                recording=recording_info)
+
+            elapsed_time = time.time() - start_time
+            monitor.frame_processed(elapsed_time)
+            if checkpoint.update(stream, {"frame_count": frame_count, "confirmation": confirmation.state()}):
+                stream.release()
+                recycle_stream(task)
+                return
+            time.sleep(max(0, 0.1 - elapsed_time))
+
+    except Exception as e:
+        if stream is not None:
+            stream.release()
+        # A stream whose camera is known down waits for the prober rather than retrying every 10s
+        wait_until_healthy(camera_id)
+        raise task.retry(exc=e, countdown=10)
+
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True, **STREAM_TASK_OPTIONS)
+def run_rule_detection(self, camera_id, model_path, record_id):
+    """Stream for a detection type defined only by its stored rules, e.g. a combined rule set."""
+    run_rule_stream(self, camera_id, model_path, record_id)
+
+
+globals()['run_rule_detection'] = run_rule_detection
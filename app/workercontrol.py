@@ -0,0 +1,62 @@
+#workercontrol.py
+from celery.worker import state as worker_state
+from celery.worker.control import control_command, nok, ok
+
+from app.client import DETECTION_TASKS
+from app.profiler import MAX_PROFILE_SECONDS, PROFILE_DIR, request_profile
+from app.redisclient import get_redis
+
+# Remote control commands of the stream workers, registered in the worker's main process by
+# app.celery. Send them with app.client or `celery -A app.celery control <command> <args>`.
+
+STREAM_TASK_NAMES = set(DETECTION_TASKS.values())
+
+
+def active_streams():
+    """(record_id, pool child pid) of every stream task running on this worker."""
+    streams = []
+    for request in list(worker_state.active_requests):
+        if request.name not in STREAM_TASK_NAMES or not request.worker_pid:
+            continue
+        # Every stream task takes (camera_id, model_path, record_id), sent positionally or by name
+        args, kwargs = request.args or (), request.kwargs or {}
+        record_id = kwargs.get("record_id", args[2] if len(args) > 2 else None)
+        if record_id is not None:
+            streams.append((int(record_id), request.worker_pid))
+    return streams
+
+
+def _request_profiles(state, pids, seconds):
+    client = get_redis()
+    for pid in pids:
+        request_profile(client, pid, seconds)
+    return ok({
+        "hostname": state.consumer.hostname,
+        "pids": sorted(pids),
+        "seconds": min(seconds, MAX_PROFILE_SECONDS),
+        "directory": PROFILE_DIR,
+    })
+
+
+@control_command(
+    args=[('record_id', int), ('seconds', float)],
+    signature='<record_id> [seconds]',
+)
+def profile_stream(state, record_id, seconds=30, **kwargs):
+    """Sample the stack of the stream of a recording for seconds, if it runs on this worker."""
+    pids = [pid for stream_record_id, pid in active_streams() if stream_record_id == int(record_id)]
+    if not pids:
+        return nok(f"recording {record_id} is not streaming on this worker")
+    return _request_profiles(state, pids, float(seconds))
+
+
+@control_command(
+    args=[('seconds', float)],
+    signature='[seconds]',
+)
+def profile_worker(state, seconds=30, **kwargs):
+    """Sample the stacks of every stream running on this worker for seconds."""
+    pids = [pid for _, pid in active_streams()]
+    if not pids:
+        return nok("no stream is running on this worker")
+    return _request_profiles(state, pids, float(seconds))
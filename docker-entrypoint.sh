@@ -0,0 +1,58 @@
+#!/bin/sh
+# Selects the celery worker profile for this container.
+#
+#   WORKER_PROFILE=streams  long-running detection streams: one message per child at a time,
+#                           fair scheduling so a busy child never holds a queued stream
+#   WORKER_PROFILE=jobs     bounded work (reports, exports, batch analysis)
+#   WORKER_PROFILE=all      both queues in one worker (development only)
+#   WORKER_PROFILE=beat     periodic job scheduler plus a single child for the camera health
+#                           probes, run exactly one per deployment
+#   WORKER_PROFILE=capture  frame bus publishers for FRAMEBUS_CAMERA_IDS (space separated)
+set -e
+
+PROFILE="${WORKER_PROFILE:-streams}"
+STREAMS_QUEUE="${CELERY_STREAMS_QUEUE:-streams-queue}"
+JOBS_QUEUE="${CELERY_JOBS_QUEUE:-jobs-queue}"
+HEALTH_QUEUE="${CELERY_HEALTH_QUEUE:-health-queue}"
+
+case "$PROFILE" in
+    streams)
+        # Exported so the core budget manager knows the pool size from the first child on
+        export WORKER_CONCURRENCY="${WORKER_CONCURRENCY:-4}"
+        exec celery -A app.celery.celery_app worker --loglevel=info \
+            --concurrency="$WORKER_CONCURRENCY" \
+            --prefetch-multiplier=1 -O fair \
+            -Q "$STREAMS_QUEUE,main-queue" \
+            --hostname="streams_worker@%h" "$@"
+        ;;
+    jobs)
+        export WORKER_CONCURRENCY="${WORKER_CONCURRENCY:-2}"
+        exec celery -A app.celery.celery_app worker --loglevel=info \
+            --concurrency="$WORKER_CONCURRENCY" \
+            --prefetch-multiplier="${WORKER_PREFETCH_MULTIPLIER:-4}" \
+            -Q "$JOBS_QUEUE" \
+            --hostname="jobs_worker@%h" "$@"
+        ;;
+    all)
+        export WORKER_CONCURRENCY="${WORKER_CONCURRENCY:-4}"
+        exec celery -A app.celery.celery_app worker --loglevel=info \
+            --concurrency="$WORKER_CONCURRENCY" \
+            --prefetch-multiplier=1 -O fair \
+            -Q "$STREAMS_QUEUE,$JOBS_QUEUE,$HEALTH_QUEUE,main-queue" \
+            --hostname="celery_worker@%h" "$@"
+        ;;
+    beat)
+        # Embedded beat, the worker only serves the health queue
+        exec celery -A app.celery.celery_app worker -B --loglevel=info \
+            --concurrency=1 \
+            -Q "$HEALTH_QUEUE" \
+            --hostname="beat_worker@%h" "$@"
+        ;;
+    capture)
+        exec python -m app.framebus $FRAMEBUS_CAMERA_IDS "$@"
+        ;;
+    *)
+        echo "Unknown WORKER_PROFILE '$PROFILE' (expected streams, jobs, all, beat or capture)" >&2
+        exit 1
+        ;;
+esac
@@ -0,0 +1,3 @@
+-- user-028: capture backend per camera, existing cameras keep OpenCV
+ALTER TABLE cameras
+    ADD COLUMN capturebackend ENUM('opencv', 'ffmpeg') DEFAULT 'opencv';
@@ -0,0 +1,3 @@
+-- user-031: cameras can read from the shared-memory frame bus
+ALTER TABLE cameras
+    MODIFY COLUMN capturebackend ENUM('opencv', 'ffmpeg', 'framebus') DEFAULT 'opencv';
@@ -0,0 +1,2 @@
+-- user-036: keyset pagination and the debounce lookup of the stream tasks
+CREATE INDEX ix_incidents_recording_timestamp_id ON incidents (recording_id, timestamp, id);
@@ -0,0 +1,13 @@
+-- user-037: frame compaction flag and per-plant retention policies
+ALTER TABLE incidents
+    ADD COLUMN framecompacted BOOLEAN DEFAULT FALSE;
+
+CREATE TABLE retentionpolicies (
+    id INTEGER NOT NULL AUTO_INCREMENT,
+    plant_id INTEGER,
+    fullframedays INTEGER,
+    retentiondays INTEGER,
+    PRIMARY KEY (id),
+    UNIQUE (plant_id),
+    FOREIGN KEY (plant_id) REFERENCES plants (id)
+);
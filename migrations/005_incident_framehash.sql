@@ -0,0 +1,6 @@
+-- user-040: perceptual hash and frame references of deduplicated incidents
+ALTER TABLE incidents
+    ADD COLUMN framehash VARCHAR(16),
+    ADD COLUMN frameref_id INTEGER,
+    ADD COLUMN occurrences INTEGER DEFAULT 1,
+    ADD FOREIGN KEY (frameref_id) REFERENCES incidents (id);
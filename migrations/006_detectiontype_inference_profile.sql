@@ -0,0 +1,7 @@
+-- user-041: inference profile of a detection type, NULL keeps the ultralytics defaults
+ALTER TABLE detectiontypes
+    ADD COLUMN classes VARCHAR(256),
+    ADD COLUMN imgsz INTEGER,
+    ADD COLUMN iou FLOAT,
+    ADD COLUMN minconfidence FLOAT,
+    ADD COLUMN maxdet INTEGER;
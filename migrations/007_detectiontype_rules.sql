@@ -0,0 +1,3 @@
+-- user-046: JSON rule list of a detection type, NULL uses the built-in rule set of its task
+ALTER TABLE detectiontypes
+    ADD COLUMN rules TEXT;
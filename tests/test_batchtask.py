@@ -0,0 +1,17 @@
+from app.batchtask import debounce_candidates
+
+
+def candidate(seconds, class_name="helmet", fps=10):
+    return {"position": int(seconds * fps), "class_name": class_name, "confidence": 0.9, "detections": [[], [], []]}
+
+
+def test_chunks_are_debounced_in_one_pass():
+    # Chunks of 300 s: A at 250 s in the first, B at 300 s and 315 s in the second
+    chunks = [[candidate(250)], [candidate(300), candidate(315)]]
+    kept = debounce_candidates([c for chunk in reversed(chunks) for c in chunk], fps=10)
+    assert [c["position"] for c in kept] == [2500, 3150]
+
+
+def test_classes_are_debounced_apart():
+    kept = debounce_candidates([candidate(0), candidate(10, "vest"), candidate(30), candidate(70, "vest")], fps=10)
+    assert [(c["position"], c["class_name"]) for c in kept] == [(0, "helmet"), (100, "vest"), (700, "vest")]
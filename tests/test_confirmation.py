@@ -0,0 +1,41 @@
+import pytest
+
+from app.confirmation import TemporalConfirmation
+
+
+def test_k_of_n():
+    confirmation = TemporalConfirmation(k=2, n=3)
+    assert confirmation.observe(["helmet"]) == set()
+    assert confirmation.observe([]) == set()
+    # Seen in 2 of the last 3 frames
+    assert confirmation.observe(["helmet"]) == {"helmet"}
+    assert confirmation.observe([]) == set()
+    # The first sighting has left the window
+    assert confirmation.observe([]) == set()
+    assert confirmation.observe(["helmet"]) == set()
+    assert confirmation.suppressed == 2
+
+
+def test_keys_out_of_view_are_dropped():
+    confirmation = TemporalConfirmation(k=1, n=2)
+    assert confirmation.observe(["vest"]) == {"vest"}
+    confirmation.observe([])
+    confirmation.observe([])
+    assert confirmation.state()["bits"] == {}
+
+
+def test_state_round_trip():
+    confirmation = TemporalConfirmation(k=3, n=5)
+    confirmation.observe(["helmet"])
+    confirmation.observe(["helmet"])
+
+    restored = TemporalConfirmation(k=3, n=5)
+    restored.load(confirmation.state())
+    assert restored.observe(["helmet"]) == {"helmet"}
+
+
+def test_k_must_fit_the_window():
+    with pytest.raises(ValueError):
+        TemporalConfirmation(k=4, n=3)
+    with pytest.raises(ValueError):
+        TemporalConfirmation(k=0, n=3)
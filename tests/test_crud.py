@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud
+from app.database import Base
+from app.models import Incident
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_incidents_page(db):
+    # Two incidents share a timestamp, the id breaks the tie
+    timestamps = [datetime(2024, 6, 1, 10), datetime(2024, 6, 1, 11), datetime(2024, 6, 1, 11), datetime(2024, 6, 1, 12)]
+    db.add_all(Incident(recording_id=1, class_name="helmet", timestamp=timestamp) for timestamp in timestamps)
+    db.add(Incident(recording_id=2, class_name="helmet", timestamp=datetime(2024, 6, 1, 11)))
+    db.commit()
+
+    pages, cursor = [], None
+    while True:
+        incidents, cursor = crud.get_incidents_page(db, 1, limit=2, cursor=cursor)
+        pages.append([incident.id for incident in incidents])
+        if cursor is None:
+            break
+    assert pages == [[4, 3], [2, 1]]
+
+    incidents, cursor = crud.get_incidents_page(db, 1, limit=4)
+    assert (len(incidents), cursor) == (4, None)
+
+
+def test_incidents_page_needs_a_limit(db):
+    with pytest.raises(ValueError):
+        crud.get_incidents_page(db, 1, limit=0)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import exporttask
+from app.database import Base
+from app.exporttask import export_incidents, get_report_data, read_watermark
+from app.models import Incident, Plant, Recording, Zone
+
+NOW = datetime(2024, 6, 1)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_incident(db, recording_id, class_name, days_old):
+    incident = Incident(recording_id=recording_id, class_name=class_name, timestamp=NOW - timedelta(days=days_old))
+    db.add(incident)
+    db.commit()
+    return incident.id
+
+
+def test_report_of_an_empty_export(tmp_path):
+    empty = {"incidents_by_type": [], "incidents_timeline": {}}
+    assert get_report_data(str(tmp_path), 1, None, 30, None, now=NOW) == empty
+    assert get_report_data(str(tmp_path / "missing"), None, None, 30, None, now=NOW) == empty
+
+
+def test_export_stops_at_the_ids_seen_before_the_safety_interval(db, tmp_path, monkeypatch):
+    plant = Plant(name="plant")
+    db.add(plant)
+    db.flush()
+    zone = Zone(title="zone", plant_id=plant.id)
+    db.add(zone)
+    db.flush()
+    recording = Recording(name="recording", zone_id=zone.id)
+    db.add(recording)
+    db.commit()
+    first = add_incident(db, recording.id, "helmet", 2)
+    second = add_incident(db, recording.id, "helmet, vest", 1)
+
+    # An incident committed while the export waits has a higher id, it is left to the next run
+    late = []
+    monkeypatch.setattr(exporttask.time, "sleep", lambda seconds: late.append(add_incident(db, recording.id, "vest", 0)))
+    stats = export_incidents(db, str(tmp_path), chunk_size=1, safety_seconds=60)
+    assert (stats["rows"], stats["to_id"]) == (2, second)
+    assert read_watermark(str(tmp_path)) == second
+
+    report = get_report_data(str(tmp_path), plant.id, None, 30, None, now=NOW)
+    assert sorted((row["type"], row["count"]) for row in report["incidents_by_type"]) == [("helmet", 2), ("vest", 1)]
+
+    stats = export_incidents(db, str(tmp_path), safety_seconds=0)
+    assert (stats["from_id"], stats["rows"], stats["to_id"]) == (second, 1, late[0])
+    assert first < second < late[0]
@@ -0,0 +1,56 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from app.framebus import FrameRing
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create(f"test-{uuid.uuid4().hex[:12]}", (4, 6, 3), slots=3)
+    yield ring
+    ring.close()
+
+
+def frame(value, shape=(4, 6, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_sequence_numbers(ring):
+    assert ring.wait_for_frame(0, timeout=0) is None
+    assert [ring.publish(frame(value)) for value in (1, 2)] == [1, 2]
+    assert ring.wait_for_frame(0, timeout=0) == 2
+    assert ring.wait_for_frame(2, timeout=0) is None
+    assert ring.view(1)[0, 0, 0] == 1 and ring.is_current(1)
+
+
+def test_overwritten_slots_are_not_current(ring):
+    for value in range(1, 5):
+        ring.publish(frame(value))
+    # Frame 1 shared its slot with frame 4
+    assert not ring.is_current(1)
+    assert ring.is_current(4) and ring.view(4)[0, 0, 0] == 4
+
+
+def test_a_slot_being_written_is_not_current(ring):
+    seq = ring.publish(frame(1))
+    ring.slot_seqs[seq % 3] = -1
+    assert not ring.is_current(seq)
+    assert ring.wait_for_frame(0, timeout=0) is None
+
+
+def test_frames_are_resized_to_the_ring(ring):
+    seq = ring.publish(frame(7, (8, 12, 3)))
+    assert ring.view(seq).shape == (4, 6, 3)
+    assert ring.view(seq)[0, 0, 0] == 7
+
+
+def test_a_reader_sees_the_writer(ring):
+    reader = FrameRing.attach(ring.shm.name)
+    try:
+        seq = ring.publish(frame(9))
+        assert reader.wait_for_frame(0, timeout=0) == seq
+        assert reader.view(seq)[0, 0, 0] == 9
+    finally:
+        reader.close()
@@ -0,0 +1,69 @@
+import numpy as np
+
+from app import ppetask
+from app.preprocess import LetterboxMeta
+from app.rules import RuleContext, build_rules
+
+NAMES = {0: "person", 1: "helmet"}
+
+
+class Array:
+    def __init__(self, values):
+        self.values = np.array(values)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class Result:
+    def __init__(self, xyxy, conf, cls):
+        self.boxes = type("Boxes", (), {})()
+        self.boxes.xyxy = Array(np.array(xyxy, dtype=np.float32).reshape(-1, 4))
+        self.boxes.conf = Array(np.array(conf, dtype=np.float32))
+        self.boxes.cls = Array(np.array(cls, dtype=np.float32))
+
+
+class Model:
+    """Returns the same result for every image of the batch."""
+
+    def __init__(self, names, result):
+        self.names = names
+        self.result = result
+        self.batches = []
+
+    def __call__(self, batch, **options):
+        self.batches.append(batch)
+        return [self.result] * batch
+
+
+class Preprocessor:
+    """Identity letterbox, tensor_batch is the number of images."""
+
+    def __call__(self, frame, index=0):
+        return LetterboxMeta(1.0, 0, 0, frame.shape[1], frame.shape[0])
+
+    def tensor_batch(self, size):
+        return size
+
+
+def test_people_without_a_crop_are_left_out(monkeypatch):
+    monkeypatch.setattr(ppetask, "PPE_MAX_CROPS", 2)
+    # Four people, the two most confident are cropped
+    people = [[10, 10, 60, 110], [100, 10, 150, 110], [200, 10, 250, 110], [300, 10, 350, 110]]
+    person_model = Model({0: "person"}, Result(people, [0.6, 0.9, 0.5, 0.8], [0, 0, 0, 0]))
+    # A helmet at the top of every crop
+    ppe_model = Model(NAMES, Result([[10, 10, 30, 30]], [0.9], [1]))
+
+    detections = ppetask.detect_two_stage(person_model, ppe_model, np.zeros((200, 400, 3), np.uint8),
+                                          Preprocessor(), Preprocessor(), 0.25, 0)
+
+    assert ppe_model.batches == [2]
+    persons = detections.cls == 0
+    assert detections.xyxy[persons].tolist() == [[100, 10, 150, 110], [300, 10, 350, 110]]
+    assert (detections.cls == 1).sum() == 2
+
+    rules = build_rules([{"type": "ppe", "required": ["helmet"]}])
+    assert rules.evaluate(detections, NAMES, 400, RuleContext(0.25, [])) == []
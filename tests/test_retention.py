@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Incident, Plant, Recording, RetentionPolicy, Zone
+from app.retentiontask import apply_retention
+
+NOW = datetime(2024, 6, 1)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def jpeg(width=1280):
+    image = np.random.default_rng(0).integers(0, 255, (width * 3 // 4, width, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+def add_incident(db, recording_id, days_old):
+    incident = Incident(recording_id=recording_id, class_name="helmet", timestamp=NOW - timedelta(days=days_old), frame=jpeg())
+    db.add(incident)
+    db.commit()
+    return incident.id
+
+
+def test_plant_policy(db):
+    plant = Plant(name="plant")
+    db.add(plant)
+    db.flush()
+    zone = Zone(title="zone", plant_id=plant.id)
+    db.add_all([zone, RetentionPolicy(plant_id=plant.id, fullframedays=5, retentiondays=10)])
+    db.flush()
+    recording = Recording(zone_id=zone.id)
+    db.add(recording)
+    db.commit()
+
+    expired = add_incident(db, recording.id, 20)
+    compacted = add_incident(db, recording.id, 7)
+    recent = add_incident(db, recording.id, 1)
+
+    apply_retention(db, now=NOW)
+
+    assert db.get(Incident, expired) is None
+    assert db.get(Incident, compacted).framecompacted
+    assert not db.get(Incident, recent).framecompacted
+
+
+def test_incidents_outside_any_plant_use_the_defaults(db):
+    zone = Zone(title="zone without plant")
+    db.add(zone)
+    db.flush()
+    in_plantless_zone = Recording(zone_id=zone.id)
+    without_zone = Recording(zone_id=None)
+    dangling_zone = Recording(zone_id=9999)
+    db.add_all([in_plantless_zone, without_zone, dangling_zone])
+    db.commit()
+
+    expired = [add_incident(db, recording_id, 400) for recording_id in
+               (in_plantless_zone.id, without_zone.id, dangling_zone.id, None, 8888)]
+    compacted = [add_incident(db, recording_id, 40) for recording_id in (in_plantless_zone.id, None)]
+
+    report = apply_retention(db, now=NOW)
+
+    assert all(db.get(Incident, incident_id) is None for incident_id in expired)
+    assert all(db.get(Incident, incident_id).framecompacted for incident_id in compacted)
+    assert report[-1]["plant_id"] is None and report[-1]["deleted"] == len(expired)
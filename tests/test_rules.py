@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.commontasks import Detections
+from app.rules import DEFAULT_RULES, RuleContext, build_rules
+
+NAMES = {0: "person", 1: "helmet", 2: "vest", 3: "forklift", 4: "Pallets_bad"}
+CONTEXT = RuleContext(confidence=0.5, scenarios=["helmet", "vest"])
+
+
+def detections(*rows):
+    """Detections from (x1, y1, x2, y2, confidence, class id) rows."""
+    table = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    return Detections(table[:, :4], table[:, 4], table[:, 5].astype(int))
+
+
+def test_presence():
+    rules = build_rules(DEFAULT_RULES["pallet"])
+    violations = rules.evaluate(detections((10, 10, 50, 50, 0.9, 4), (60, 10, 90, 50, 0.4, 4)), NAMES, 640, CONTEXT)
+    assert [(v.class_name, v.region) for v in violations] == [("Pallets_bad", (10.0, 10.0, 50.0, 50.0))]
+    assert rules.evaluate(detections((10, 10, 50, 50, 0.4, 4)), NAMES, 640, CONTEXT) == []
+
+
+def test_ppe_containment():
+    rules = build_rules(DEFAULT_RULES["ppe"])
+    frame = detections(
+        (0, 0, 100, 200, 0.9, 0), (10, 0, 40, 30, 0.8, 1), (10, 50, 90, 120, 0.8, 2),  # fully equipped
+        (200, 0, 300, 200, 0.7, 0), (210, 0, 240, 30, 0.8, 1),                          # no vest
+        (150, 0, 180, 30, 0.8, 1),                                                      # a helmet outside every person
+    )
+    violations = rules.evaluate(frame, NAMES, 640, CONTEXT)
+    assert [(v.class_name, v.boxes.tolist()) for v in violations] == [("vest", [[200, 0, 300, 200]])]
+    assert rules.incidents(violations) == [("vest", pytest.approx(0.7), (200.0, 0.0, 300.0, 200.0))]
+
+
+def test_ppe_incident_lists_every_missing_class():
+    rules = build_rules(DEFAULT_RULES["ppe"])
+    violations = rules.evaluate(detections((0, 0, 100, 200, 0.9, 0)), NAMES, 640, CONTEXT)
+    assert [incident[0] for incident in rules.incidents(violations)] == ["helmet,vest"]
+
+
+def test_proximity_scales_with_the_frame_width():
+    rules = build_rules(DEFAULT_RULES["forklift"])
+    # Centres 400 px apart: beyond 350 px on a 640 wide frame, within it on a 1280 wide one
+    frame = detections((0, 0, 100, 100, 0.9, 0), (400, 0, 500, 100, 0.8, 3))
+    assert rules.evaluate(frame, NAMES, 640, CONTEXT) == []
+    violations = rules.evaluate(frame, NAMES, 1280, CONTEXT)
+    assert [(v.class_name, v.confidence) for v in violations] == [("person_forklift_proximity", pytest.approx(0.8))]
+
+
+def test_classes_of_a_combined_rule_set():
+    rules = build_rules('[{"type": "ppe"}, {"type": "presence", "classes": ["Pallets_bad"], "name": "pallets"}]')
+    assert rules.classes(CONTEXT) == ("Pallets_bad", "helmet", "person", "vest")
+
+
+@pytest.mark.parametrize("config", [
+    [{"type": "unknown"}],
+    [{"classes": ["Pallets_bad"]}],
+    [{"type": "presence"}],
+    [{"type": "proximity", "range": 10}],
+    [{"type": "ppe"}, {"type": "ppe"}],
+])
+def test_invalid_configs(config):
+    with pytest.raises(ValueError):
+        build_rules(config)